@@ -4,10 +4,16 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import html, logging
 from utils.db import (
+    run_db,
     set_premium, block_user, unblock_user, get_users_count,
     get_pending_payments, approve_payment, get_payment_by_id,
-    reject_payment, get_free_uses, get_blocked_users, get_all_users
+    reject_payment, reset_free_uses, get_blocked_users
 )
+from utils import gen_cache, rate_limiter, model_router
+from utils.circuit_breaker import openai_breaker
+from utils.openai_api import continuation_stats
+from utils.job_queue import counts as job_counts
+from utils.doc_store import storage_report
 from config import ADMIN_ID
 
 router = Router()
@@ -39,12 +45,20 @@ async def admin_panel(msg: types.Message):
 async def show_stats(msg: types.Message):
     if not is_admin(msg):
         return await msg.answer("⛔ Siz admin emassiz.")
-    total_users = get_users_count()
-    blocked = len(get_blocked_users())
+    total_users = await run_db(get_users_count)
+    blocked = len(await run_db(get_blocked_users))
+    jobs = await job_counts()
+    docs = await storage_report()
     await msg.answer(
         f"📈 <b>Statistika:</b>\n\n"
         f"👥 Foydalanuvchilar: <b>{total_users}</b>\n"
-        f"🚫 Bloklanganlar: <b>{blocked}</b>",
+        f"🚫 Bloklanganlar: <b>{blocked}</b>\n"
+        f"🧾 Ishlar: navbatda <b>{jobs.get('enqueued', 0)}</b>, bajarilmoqda <b>{jobs.get('running', 0)}</b>, "
+        f"xato <b>{jobs.get('failed', 0)}</b>\n"
+        f"🗜 Matnlar: <b>{docs['documents']}</b> ta ({docs['entries']} yozuv), "
+        f"{docs['stored'] // 1024} KB saqlangan, <b>{docs['saved'] // 1024} KB</b> tejaldi\n"
+        f"⏳ OpenAI navbati: <b>{rate_limiter.queue_depth()}</b>\n"
+        f"🔌 OpenAI holati: <b>{openai_breaker.state}</b> (/breaker)",
         parse_mode="HTML"
     )
 
@@ -55,7 +69,7 @@ async def payments_handler(msg: types.Message):
     if not is_admin(msg):
         return await msg.answer("⛔ Siz admin emassiz.")
 
-    payments = get_pending_payments()
+    payments = await run_db(get_pending_payments)
     if not payments:
         return await msg.answer("✅ Hozircha kutilayotgan to‘lovlar yo‘q.")
 
@@ -98,7 +112,7 @@ async def approve_callback(callback: types.CallbackQuery):
         return await callback.answer("⛔ Siz admin emassiz.", show_alert=True)
 
     payment_id = int(callback.data.split("_", 1)[1])
-    payment = get_payment_by_id(payment_id)
+    payment = await run_db(get_payment_by_id, payment_id)
     if not payment:
         return await callback.answer("❌ To‘lov topilmadi.", show_alert=True)
 
@@ -108,17 +122,11 @@ async def approve_callback(callback: types.CallbackQuery):
     user_id = payment[1]
     username = payment[2] or "foydalanuvchi"
 
-    approve_payment(payment_id)
-    set_premium(user_id, 1)
+    await run_db(approve_payment, payment_id)
+    await run_db(set_premium, user_id, 1)
 
     # agar 3 martalik limit tugagan bo‘lsa — nolga tushuramiz
-    if get_free_uses(user_id) >= 3:
-        from utils.db import connect
-        conn = connect()
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET free_uses = 0 WHERE user_id=?", (user_id,))
-        conn.commit()
-        conn.close()
+    await run_db(reset_free_uses, user_id)
 
     await callback.message.edit_caption(
         f"✅ <b>To‘lov tasdiqlandi!</b>\n\n"
@@ -149,11 +157,11 @@ async def reject_callback(callback: types.CallbackQuery):
         return await callback.answer("⛔ Siz admin emassiz.", show_alert=True)
 
     payment_id = int(callback.data.split("_", 1)[1])
-    payment = get_payment_by_id(payment_id)
+    payment = await run_db(get_payment_by_id, payment_id)
     if not payment:
         return await callback.answer("❌ To‘lov topilmadi.", show_alert=True)
 
-    reject_payment(payment_id)
+    await run_db(reject_payment, payment_id)
 
     await callback.message.edit_caption("❌ <b>Rad etildi.</b> Admin tomonidan rad etildi.", parse_mode="HTML")
 
@@ -175,7 +183,7 @@ async def block_callback(callback: types.CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         return await callback.answer("⛔ Siz admin emassiz.", show_alert=True)
     user_id = int(callback.data.split("_", 1)[1])
-    block_user(user_id)
+    await run_db(block_user, user_id)
     await callback.message.edit_caption("⛔ <b>Foydalanuvchi bloklandi.</b>", parse_mode="HTML")
     try:
         await callback.message.bot.send_message(user_id, "⛔ Siz administrator tomonidan bloklandingiz.")
@@ -189,7 +197,7 @@ async def block_callback(callback: types.CallbackQuery):
 async def unblock_command(msg: types.Message):
     if not is_admin(msg):
         return await msg.answer("⛔ Siz admin emassiz.")
-    blocked_users = get_blocked_users()
+    blocked_users = await run_db(get_blocked_users)
     if not blocked_users:
         return await msg.answer("✅ Bloklangan foydalanuvchilar yo‘q.")
     text = "🚫 <b>Bloklangan foydalanuvchilar:</b>\n\n"
@@ -208,9 +216,79 @@ async def unblock_cmd(msg: types.Message):
     if len(parts) < 2:
         return await msg.answer("🔧 Foydalanuvchini unbloklash uchun ID yuboring.\nMasalan: /unblock 123456789")
     user_id = int(parts[1])
-    unblock_user(user_id)
+    await run_db(unblock_user, user_id)
     await msg.answer(f"✅ Foydalanuvchi ({user_id}) qayta faollashtirildi.")
     try:
         await msg.bot.send_message(user_id, "✅ Sizning profilingiz yana faollashtirildi.")
     except:
         pass
+
+
+# === /cache — generatsiya keshi holati ===
+@router.message(Command("cache"))
+async def cache_stats_cmd(msg: types.Message):
+    if not is_admin(msg):
+        return await msg.answer("⛔ Siz admin emassiz.")
+    info = await gen_cache.summary()
+    await msg.answer(
+        f"🗄 <b>Generatsiya keshi:</b>\n\n"
+        f"📦 Yozuvlar: <b>{info['entries']}</b>\n"
+        f"✅ Hit: <b>{info['hits']}</b>\n"
+        f"❌ Miss: <b>{info['misses']}</b>\n"
+        f"📈 Hit ratio: <b>{info['hit_ratio']:.0%}</b>\n\n"
+        f"Tozalash: /cache_clear [fan yoki mavzu qismi]",
+        parse_mode="HTML"
+    )
+
+
+# === /cache_clear [matn] ===
+@router.message(Command("cache_clear"))
+async def cache_clear_cmd(msg: types.Message):
+    if not is_admin(msg):
+        return await msg.answer("⛔ Siz admin emassiz.")
+    parts = msg.text.strip().split(maxsplit=1)
+    label_part = parts[1] if len(parts) > 1 else None
+    removed = await gen_cache.invalidate(label_part)
+    target = f"«{html.escape(label_part)}»" if label_part else "barcha"
+    await msg.answer(f"🧹 Keshdan {target} yozuvlar o‘chirildi: {removed} ta.")
+
+
+# === /breaker — OpenAI circuit breaker holati ===
+@router.message(Command("breaker"))
+async def breaker_cmd(msg: types.Message):
+    if not is_admin(msg):
+        return await msg.answer("⛔ Siz admin emassiz.")
+    st = openai_breaker.status()
+    await msg.answer(
+        f"🔌 <b>OpenAI circuit breaker:</b>\n\n"
+        f"Holat: <b>{st['state']}</b>\n"
+        f"Xato ulushi: <b>{st['error_rate']:.0%}</b> (oxirgi {st['calls']} ta)\n"
+        f"Rad etilgan so‘rovlar: <b>{st['rejected']}</b>\n"
+        f"Qayta sinovgacha: <b>{st['retry_in']:.0f}</b> s",
+        parse_mode="HTML"
+    )
+
+
+# === /models — modellar kechikishi va hedge statistikasi ===
+@router.message(Command("models"))
+async def models_cmd(msg: types.Message):
+    if not is_admin(msg):
+        return await msg.answer("⛔ Siz admin emassiz.")
+    stats = model_router.snapshot()
+    if not stats:
+        return await msg.answer("📉 Hali OpenAI chaqiruvlari bo‘lmadi.")
+    fmt = lambda v: f"{v:.1f}s" if v is not None else "—"
+    text = "🧠 <b>Modellar:</b>\n\n"
+    for model, st in stats.items():
+        text += (
+            f"<code>{html.escape(model)}</code>: p50 {fmt(st['p50'])}, p95 {fmt(st['p95'])}, "
+            f"xato {st['error_rate']:.0%} ({st['calls']} ta)\n"
+        )
+    text += f"\n🔀 Hedge: {model_router.hedges['started']} ta, shundan {model_router.hedges['won']} tasi yutdi"
+    cont = continuation_stats
+    if cont["requests"]:
+        text += (
+            f"\n✂️ Davom ettirilgan javoblar: {cont['requests']} ta ({cont['rounds']} so‘rov), "
+            f"+{cont['tokens']} token, +{cont['seconds']:.0f}s; byudjet tugagan: {cont['exhausted']}"
+        )
+    await msg.answer(text, parse_mode="HTML")
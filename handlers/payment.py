@@ -1,7 +1,8 @@
 # handlers/payment.py
 from aiogram import Router, types, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.db import add_payment, is_blocked
+from utils.db import run_db, add_payment
+from middlewares.user_context import UserProfile
 from config import ADMIN_ID
 import html
 import logging
@@ -10,8 +11,8 @@ router = Router()
 logger = logging.getLogger(__name__)
 
 @router.message(F.photo)
-async def payment_photo_handler(msg: types.Message):
-    if is_blocked(msg.from_user.id):
+async def payment_photo_handler(msg: types.Message, profile: UserProfile):
+    if profile.blocked:
         return await msg.answer("⛔ Kirish cheklangan. Administrator bilan bog‘laning.")
 
     file_id = msg.photo[-1].file_id
@@ -21,7 +22,7 @@ async def payment_photo_handler(msg: types.Message):
 
     # DB ga yozish va payment_id olish
     try:
-        payment_id = add_payment(user_id, username, file_id)
+        payment_id = await run_db(add_payment, user_id, username, file_id)
     except Exception as e:
         logger.exception("add_payment xatolik: %s", e)
         await msg.answer("❌ To‘lovni saqlashda xatolik yuz berdi. Iltimos, administrator bilan bog‘laning.")
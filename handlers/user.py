@@ -2,45 +2,45 @@
 from aiogram import Router, types, F
 from aiogram.filters import CommandStart
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-import pandas as pd, os, logging
-from docx import Document
+import os
+import logging
 
 from utils.db import (
-    add_user, is_premium, is_blocked, save_history,
-    set_state, get_state, set_subject, get_subject,
-    set_grade, get_grade, add_payment,
-    get_free_uses, increment_free_use
+    run_db, save_last_request, get_history_page, get_history_entry,
+    consume_free_use, FREE_USES_LIMIT
 )
-from utils.openai_api import (
-    generate_conspect, generate_lesson_plan, generate_methodical_advice, analyze_teaching_problem
-)
-from utils.docx_generator import create_named_docx, get_preview
+from utils.delivery import resend_history_entry
+from utils.circuit_breaker import openai_breaker, BREAKER_MESSAGE
+from utils.excel_reader import read_topics_async, TopicFileError, TOPICS_MAX_BYTES
+from utils.job_queue import job_queue
+from utils.tokens import check_input, PromptTooLargeError, MAX_TOPIC_TOKENS, MAX_INPUT_TOKENS
+from middlewares.user_context import UserProfile
 from config import ADMIN_ID
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "8"))
+
 # === Asosiy menyu ===
+MENU_ROWS = (
+    ("📄 Yangi Konspekt", "📘 Dars ishlanma yaratish"),
+    ("📙 Metodik maslahat", "📂 Mening konspektlarim"),
+    ("🪄 Muammoni tahlil qilish", "📤 Excel fayldan konspekt yaratish"),
+)
+MENU_BUTTONS = frozenset(text for row in MENU_ROWS for text in row)
+
 def main_menu():
     return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📄 Yangi Konspekt"), KeyboardButton(text="📘 Dars ishlanma yaratish")],
-            [KeyboardButton(text="📙 Metodik maslahat"), KeyboardButton(text="📂 Mening konspektlarim")],
-            [KeyboardButton(text="🪄 Muammoni tahlil qilish"), KeyboardButton(text="📤 Excel fayldan konspekt yaratish")]
-        ],
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in MENU_ROWS],
         resize_keyboard=True
     )
 
 # === /start buyrug‘i ===
 @router.message(CommandStart())
-async def start_handler(msg: types.Message):
-    """Foydalanuvchi /start yuborganda ishlaydi"""
-    user_id = msg.from_user.id
-    username = msg.from_user.username
-
-    add_user(user_id, username)
-
-    if is_blocked(user_id):
+async def start_handler(msg: types.Message, profile: UserProfile):
+    """Foydalanuvchi /start yuborganda ishlaydi (profil middleware'da yaratiladi)"""
+    if profile.blocked:
         return await msg.answer("⛔ Sizning profilingiz bloklangan.")
 
     await msg.answer(
@@ -54,84 +54,224 @@ async def start_handler(msg: types.Message):
 
 # === 📄 Yangi Konspekt ===
 @router.message(F.text == "📄 Yangi Konspekt")
-async def new_conspect(msg: types.Message):
-    if is_blocked(msg.from_user.id):
+async def new_conspect(msg: types.Message, profile: UserProfile):
+    if profile.blocked:
         return await msg.answer("⛔ Siz bloklangansiz.")
-    if not await check_limit(msg.from_user.id, msg): return
+    if not await check_limit(profile, msg): return
     await msg.answer("Fan nomini kiriting (masalan: Matematika):")
-    set_state(msg.from_user.id, "subject")
+    profile.state = "subject"
+
+# === 📘 Dars ishlanma / 📙 Metodik maslahat: konspekt bilan bir xil bosqichlar ===
+@router.message(F.text == "📘 Dars ishlanma yaratish")
+async def new_lesson_plan(msg: types.Message, profile: UserProfile):
+    await _start_flow(msg, profile, LESSON_PREFIX, "📘 Dars ishlanma.")
+
+@router.message(F.text == "📙 Metodik maslahat")
+async def new_advice(msg: types.Message, profile: UserProfile):
+    await _start_flow(msg, profile, ADVICE_PREFIX, "📙 Metodik maslahat.")
+
+async def _start_flow(msg: types.Message, profile: UserProfile, prefix: str, intro: str):
+    if profile.blocked:
+        return await msg.answer("⛔ Siz bloklangansiz.")
+    if not await check_limit(profile, msg): return
+    await msg.answer(f"{intro}\nFan nomini kiriting (masalan: Matematika):")
+    profile.state = prefix + "subject"
+
+# === 🪄 Muammoni tahlil qilish: bitta erkin matn ===
+@router.message(F.text == "🪄 Muammoni tahlil qilish")
+async def new_problem(msg: types.Message, profile: UserProfile):
+    if profile.blocked:
+        return await msg.answer("⛔ Siz bloklangansiz.")
+    if not await check_limit(profile, msg): return
+    await msg.answer("🪄 Dars yoki o‘quvchilar bilan bog‘liq muammoni batafsil yozing:")
+    profile.state = "problem"
+
+def in_problem_flow(msg: types.Message, profile: UserProfile) -> bool:
+    return profile.state == "problem" and not msg.text.startswith("/") and msg.text not in MENU_BUTTONS
+
+@router.message(F.text, in_problem_flow)
+async def problem_flow(msg: types.Message, profile: UserProfile):
+    text = msg.text.strip()
+    try:
+        check_input(text, MAX_INPUT_TOKENS, "Muammo matni")
+    except PromptTooLargeError as e:
+        return await msg.answer(str(e))
+    profile.state = None
+    await _enqueue_generation(msg, profile, "problem", "Tahlil", {"problem": text})
+
+# === Konspekt / dars ishlanma / maslahat bosqichlari: fan → sinf → mavzu ===
+LESSON_PREFIX = "lesson_"
+ADVICE_PREFIX = "advice_"
+FLOW_STEPS = ("subject", "grade", "topic")
+# holat prefiksi → (ish turi, foydalanuvchiga ko‘rinadigan nom)
+FLOW_JOBS = {
+    "": ("conspect", "Konspekt"),
+    LESSON_PREFIX: ("lesson", "Dars ishlanma"),
+    ADVICE_PREFIX: ("advice", "Metodik maslahat"),
+}
+CONSPECT_STATES = tuple(prefix + step for prefix in FLOW_JOBS for step in FLOW_STEPS)
+
+def in_conspect_flow(msg: types.Message, profile: UserProfile) -> bool:
+    # menyu tugmalari o‘z handleriga o‘tadi — fan/sinf/mavzu sifatida saqlanmaydi
+    return (
+        profile.state in CONSPECT_STATES
+        and not msg.text.startswith("/")
+        and msg.text not in MENU_BUTTONS
+    )
+
+@router.message(F.text, in_conspect_flow)
+async def conspect_flow(msg: types.Message, profile: UserProfile):
+    text = msg.text.strip()
+    prefix = next((p for p in FLOW_JOBS if p and profile.state.startswith(p)), "")
+    step = profile.state[len(prefix):]
+    if step == "subject":
+        profile.subject, profile.state = text, prefix + "grade"
+        return await msg.answer("Sinfni kiriting (masalan: 5):")
+    if step == "grade":
+        profile.grade, profile.state = text, prefix + "topic"
+        return await msg.answer("Mavzuni kiriting (masalan: Kasrlar):")
+
+    try:
+        check_input(text, MAX_TOPIC_TOKENS, "Mavzu")
+    except PromptTooLargeError as e:
+        return await msg.answer(str(e))
+
+    profile.state = None
+    subject, grade, topic = profile.subject, profile.grade, text
+    await run_db(save_last_request, profile.user_id, subject, grade, topic)
+
+    kind, title = FLOW_JOBS[prefix]
+    await _enqueue_generation(msg, profile, kind, title, {"subject": subject, "grade": grade, "topic": topic})
+
+async def _enqueue_generation(msg: types.Message, profile: UserProfile, kind: str, title: str, payload: dict):
+    # generatsiya navbatdagi ishda bajariladi — bot qayta ishga tushsa ham yo‘qolmaydi
+    is_full = profile.user_id == ADMIN_ID or profile.premium
+    status = await msg.answer(f"✅ So‘rovingiz qabul qilindi. {title} tayyor bo‘lishi bilan shu yerda ko‘rinadi ⏳")
+    _, created = await job_queue.enqueue(
+        kind, f"{kind}:{msg.chat.id}:{msg.message_id}", profile.user_id, msg.chat.id,
+        {
+            **payload,
+            "full": is_full,
+            # bepul imkoniyat menyu tugmasi bosilganda sarflangan — xato bo‘lsa qaytariladi
+            "free_use": not is_full,
+            "status_message_id": status.message_id,
+        }
+    )
+    if not created:
+        await status.edit_text("⏳ Bu so‘rov allaqachon navbatda.")
+
+# === 📂 Mening konspektlarim (sahifalab) ===
+# callback_data: "hp:o:<id>" — <id> dan eskilari, "hp:n:<id>" — yangilari
+def history_keyboard(rows, has_older: bool, has_newer: bool):
+    buttons = [
+        [InlineKeyboardButton(text=f"📄 {subject} — {topic}"[:60], callback_data=f"hist_{entry_id}")]
+        for entry_id, subject, topic in rows
+    ]
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️ Yangiroq", callback_data=f"hp:n:{rows[0][0]}"))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="Eskiroq ➡️", callback_data=f"hp:o:{rows[-1][0]}"))
+    if nav:
+        buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-# === Boshqa buyruqlar / textlar (qisqartirilgan) ===
-# ... (sening qolgan logikalaringni o‘zgartirish shart emas)
+@router.message(F.text == "📂 Mening konspektlarim")
+async def my_conspects(msg: types.Message, profile: UserProfile):
+    rows, has_older, has_newer = await run_db(get_history_page, profile.user_id, HISTORY_PAGE_SIZE)
+    if not rows:
+        return await msg.answer("📂 Sizda hali konspektlar yo‘q.")
+    await msg.answer("📂 Konspektlaringiz:", reply_markup=history_keyboard(rows, has_older, has_newer))
+
+@router.callback_query(F.data.startswith("hp:"))
+async def history_page(callback: types.CallbackQuery, profile: UserProfile):
+    _, direction, entry_id = callback.data.split(":")
+    cursor = {"before_id" if direction == "o" else "after_id": int(entry_id)}
+    rows, has_older, has_newer = await run_db(get_history_page, profile.user_id, HISTORY_PAGE_SIZE, **cursor)
+    if not rows:
+        # kursor yozuvi o‘chirilgan — boshidan ko‘rsatamiz
+        rows, has_older, has_newer = await run_db(get_history_page, profile.user_id, HISTORY_PAGE_SIZE)
+    if not rows:
+        return await callback.answer("📂 Sizda hali konspektlar yo‘q.", show_alert=True)
+    try:
+        await callback.message.edit_reply_markup(reply_markup=history_keyboard(rows, has_older, has_newer))
+    except Exception as e:
+        logger.debug("Tarix sahifasini yangilab bo‘lmadi: %s", e)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("hist_"))
+async def resend_history(callback: types.CallbackQuery, profile: UserProfile):
+    entry = await run_db(get_history_entry, profile.user_id, int(callback.data.split("_", 1)[1]))
+    if not entry:
+        return await callback.answer("❌ Konspekt topilmadi.", show_alert=True)
+    if not await resend_history_entry(callback.bot, callback.from_user.id, entry):
+        return await callback.answer("❌ Bu fayl endi mavjud emas.", show_alert=True)
+    await callback.answer()
 
 # === Excel fayldan konspekt yaratish ===
 @router.message(F.text.contains("Excel fayldan"))
-async def excel_instruction(msg: types.Message):
+async def excel_instruction(msg: types.Message, profile: UserProfile):
     await msg.answer(
         "📘 Excel fayldan konspekt yaratish bo‘limi.\n\n"
         "🧩 Excel faylni quyidagicha tayyorlang:\n"
         "1. Faqat bitta ustun bo‘lsin — <b>Mavzu</b> (birinchi qatorda yozing).\n"
-        "2. Faylni .xlsx formatda saqlang.\n"
+        "2. Faylni .xlsx (yoki .csv) formatda saqlang.\n"
         "3. So‘ng faylni shu yerga yuboring 📎",
         parse_mode="HTML"
     )
-    set_state(msg.from_user.id, "excel_upload")
+    profile.state = "excel_upload"
 
 @router.message(F.document)
-async def handle_excel_file(msg: types.Message):
-    user_id = msg.from_user.id
-    state = get_state(user_id)
-    if state != "excel_upload":
+async def handle_excel_file(msg: types.Message, profile: UserProfile):
+    user_id = profile.user_id
+    if profile.state != "excel_upload":
         return
 
-    file_path = f"temp_{user_id}.xlsx"
-    await msg.bot.download(msg.document, file_path)
+    document = msg.document
+    if document.file_size and document.file_size > TOPICS_MAX_BYTES:
+        return await msg.answer(f"❌ Fayl juda katta (maksimum {TOPICS_MAX_BYTES // (1024 * 1024)} MB).")
 
     try:
-        df = pd.read_excel(file_path)
-        if df.empty or "Mavzu" not in df.columns:
-            await msg.answer("❌ Faylda 'Mavzu' nomli ustun topilmadi.")
-            os.remove(file_path)
-            return
-
-        topics = df["Mavzu"].dropna().tolist()
-        total = len(topics)
-        await msg.answer(f"⏳ {total} ta mavzu uchun konspekt yaratilmoqda...")
-
-        topics_text = "\n".join([f"{i+1}. {t}" for i, t in enumerate(topics)])
-        prompt = (
-            f"Quyidagi {total} ta mavzu bo‘yicha o‘qituvchilar uchun batafsil konspekt yozing.\n\n{topics_text}"
+        # fayl diskka yozilmaydi — to‘g‘ridan-to‘g‘ri xotiraga yuklanadi
+        buffer = await msg.bot.download(document)
+        topics = await read_topics_async(buffer.getvalue(), document.file_name)
+        if not topics:
+            return await msg.answer("❌ 'Mavzu' ustunida birorta ham mavzu topilmadi.")
+        status = await msg.answer(f"✅ {len(topics)} ta mavzu qabul qilindi. Yig‘ma konspekt tayyor bo‘lgach yuboriladi ⏳")
+        # har bir mavzu navbatdagi ish ichida, cheklangan parallellikda generatsiya qilinadi
+        _, created = await job_queue.enqueue(
+            "bulk", f"bulk:{msg.chat.id}:{msg.message_id}", user_id, msg.chat.id,
+            {"topics": topics, "status_message_id": status.message_id}
         )
+        if not created:
+            await status.edit_text("⏳ Bu fayl allaqachon navbatda.")
 
-        result = generate_conspect("Umumiy fan", "Har xil sinflar", prompt)
-        doc = Document()
-        doc.add_heading("Yig‘ma Konspekt", level=0)
-        doc.add_paragraph(result)
-        output = f"{user_id}_yigma_konspekt.docx"
-        doc.save(output)
-
-        await msg.answer_document(types.FSInputFile(output), caption="✅ Yig‘ma konspekt tayyor!")
-        os.remove(file_path)
-        os.remove(output)
-
+    except TopicFileError as e:
+        await msg.answer(str(e))
     except Exception as e:
         await msg.answer(f"❌ Xatolik: {e}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 # === Limit funksiyasi (alohida pastda) ===
-async def check_limit(uid: int, msg: types.Message):
-    if uid == ADMIN_ID or is_premium(uid):
+async def check_limit(profile: UserProfile, msg: types.Message):
+    if profile.user_id == ADMIN_ID or profile.premium:
         return True
 
-    free_uses = get_free_uses(uid)
-    if free_uses < 3:
-        increment_free_use(uid)
-        await msg.answer(f"🎁 Bepul foydalanish: {free_uses + 1}/3")
+    # xizmat ishlamayotgan paytda bepul imkoniyat sarflanmaydi
+    if openai_breaker.is_open():
+        await msg.answer(BREAKER_MESSAGE + "\n🎁 Bepul imkoniyatingiz sarflanmadi.")
+        return False
+
+    # tekshiruv va sarflash bitta UPDATE da — ikki tez bosish ikkita imkoniyat ololmaydi
+    used = await run_db(consume_free_use, profile.user_id)
+    if used == 0:
+        return True  # premium endigina faollashgan
+    if used is not None:
+        profile.sync(free_uses=used)
+        await msg.answer(f"🎁 Bepul foydalanish: {used}/{FREE_USES_LIMIT}")
         return True
     else:
         await msg.answer(
-            "🎁 3 ta bepul imkoniyat tugadi.\n"
+            f"🎁 {FREE_USES_LIMIT} ta bepul imkoniyat tugadi.\n"
             "🔐 15 000 UZS to‘lov bilan Premium faollashtiring.",
             parse_mode="HTML"
         )
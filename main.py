@@ -1,31 +1,90 @@
 # main.py
 import os
+import hmac
+import time
+import signal
 import asyncio
 from aiohttp import web
 from aiogram import Bot, Dispatcher, types
-from config import BOT_TOKEN
+from config import BOT_TOKEN, ADMIN_ID
 from handlers.user import router as user_router
 from handlers.admin import router as admin_router
-from utils.db import init_db
+from utils.db import migrate, close_db, allow_unlimited
+from utils.openai_api import close_client
+from utils.update_queue import UpdateQueue
+from utils.job_queue import job_queue, JOB_WORKERS, counts as job_counts
+from utils.jobs import register_jobs
+from middlewares.user_context import UserContextMiddleware
+from middlewares.metrics import MetricsMiddleware
+from utils.circuit_breaker import openai_breaker
+from utils import metrics, rate_limiter
 
-# === Database init ===
-init_db()
+# === Admin ===
+allow_unlimited(ADMIN_ID)  # admin uchun kvota so‘rovi yuborilmaydi
 
 # === Webhook sozlamalari ===
 WEBHOOK_HOST = os.getenv("RENDER_EXTERNAL_URL")  # Render avtomatik URL beradi
 WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else None
 
+# "queue" — darhol "ok" qaytarib, update fon workerlarida ishlanadi; "sync" — eski rejim
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queue").lower()
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "500"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+
+# === /metrics (Prometheus) — faqat METRICS_TOKEN berilganda, ?token=... yoki Bearer bilan ===
+# token bo‘lmasa endpoint umuman ochilmaydi (handler nomlari, xatolar va navbatlar ommaga ko‘rinmasin)
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# === Har bir update uchun foydalanuvchi profili (bitta so‘rov) ===
+dp.update.outer_middleware(UserContextMiddleware())
+# handler vaqtlari (ichki routerlarga ham tarqaladi)
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
+
 # === Routerlarni ulaymiz ===
 dp.include_router(user_router)
 dp.include_router(admin_router)
 #dp.include_router(payment_router)  # Agar alohida payment.py bo‘lsa, shu qatorni aktivlashtiring
 
+update_queue = UpdateQueue(dp, bot, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE) if WEBHOOK_MODE == "queue" else None
+
+# === Circuit breaker holati o‘zgarsa — adminga xabar ===
+# task'lar tugaguncha shu yerda saqlanadi (aks holda GC yo‘qotishi mumkin)
+_notify_tasks = set()
+
+def _notify_done(task: asyncio.Task):
+    _notify_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"⚠️ Adminga breaker xabari yuborilmadi: {task.exception()}")
+
+def notify_breaker_change(name, old, new):
+    print(f"🔌 Circuit breaker [{name}]: {old} → {new}")
+    task = asyncio.get_running_loop().create_task(
+        bot.send_message(ADMIN_ID, f"🔌 OpenAI circuit breaker: {old} → {new}")
+    )
+    _notify_tasks.add(task)
+    task.add_done_callback(_notify_done)
+
+openai_breaker.on_change = notify_breaker_change
+
+# === Generatsiya ishlari (SQLite navbat) ===
+register_jobs(job_queue)
+
 # === Webhook startup ===
 async def on_startup(app):
+    # sxema migratsiyalari — importda emas, server ishga tushganda bir marta
+    print(f"🗄 Baza sxemasi: v{migrate()}")
+    if update_queue:
+        update_queue.start()
+        print(f"📥 Update navbati: {UPDATE_WORKERS} ta worker, hajmi {UPDATE_QUEUE_SIZE}")
+    await job_queue.start(bot)
+    print(f"🧾 Ishlar navbati: {JOB_WORKERS} ta worker")
     if WEBHOOK_URL:
         try:
             await bot.set_webhook(WEBHOOK_URL)
@@ -39,25 +98,69 @@ async def on_startup(app):
 async def on_shutdown(app):
     try:
         await bot.delete_webhook()
+        if update_queue:
+            await update_queue.stop(SHUTDOWN_DRAIN_TIMEOUT)
+        # tugamagan ishlar bazada qoladi va keyingi ishga tushishda davom etadi
+        await job_queue.stop(SHUTDOWN_DRAIN_TIMEOUT)
         await bot.session.close()
+        await close_client()
+        await close_db()
         print("🛑 Webhook o‘chirildi va sessiya yopildi.")
     except Exception as e:
         print(f"⚠️ Yopilishda xato: {e}")
 
 # === Update handler ===
 async def handle_webhook(request):
+    started = time.perf_counter()
+    try:
+        return await _handle_webhook(request)
+    finally:
+        metrics.WEBHOOK.observe(time.perf_counter() - started)
+
+async def _handle_webhook(request):
     try:
         data = await request.json()
         update = types.Update(**data)
+    except Exception as e:
+        print(f"⚠️ Update o‘qishda xato: {e}")
+        return web.Response(text="ok")
+
+    if update_queue:
+        accepted = await update_queue.put(update)
+        if accepted is False:
+            # navbat to‘la — Telegram update'ni keyinroq qayta yuboradi
+            return web.Response(status=503, text="busy")
+        return web.Response(text="ok")
+
+    try:
         await dp.feed_update(bot, update)
     except Exception as e:
         print(f"⚠️ Update qayta ishlashda xato: {e}")
     return web.Response(text="ok")
 
+# === Metrikalar ===
+async def handle_metrics(request):
+    auth = request.headers.get("Authorization", "")
+    given = request.query.get("token") or auth.removeprefix("Bearer ")
+    if not hmac.compare_digest(given.encode(), METRICS_TOKEN.encode()):
+        return web.Response(status=403, text="forbidden")
+    # navbat holati scrape paytida olinadi — hot path'da hech narsa hisoblanmaydi
+    metrics.queue_depth.labels("updates").set(update_queue.qsize() if update_queue else 0)
+    metrics.queue_depth.labels("openai").set(rate_limiter.queue_depth())
+    metrics.queue_depth.labels("jobs_running").set(job_queue.in_progress())
+    jobs = await job_counts()
+    for status in ("enqueued", "running", "done", "failed"):
+        metrics.jobs_gauge.labels(status).set(jobs.get(status, 0))
+    return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
 # === Asosiy server ===
 async def main():
     app = web.Application()
     app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    if METRICS_TOKEN:
+        app.router.add_get(METRICS_PATH, handle_metrics)
+    else:
+        print("ℹ️ METRICS_TOKEN berilmagan — /metrics o‘chiq.")
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
 
@@ -70,8 +173,19 @@ async def main():
     await site.start()
 
     print("🤖 Bot ishlayapti! Webhook mode aktiv.")
-    while True:
-        await asyncio.sleep(3600)
+
+    # SIGTERM (Render restart) kelganda on_shutdown ishlab, navbat bo‘shatilsin
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    try:
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,28 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils import metrics
+
+
+# === Inner middleware: handler nomi bo‘yicha bajarilish vaqti ===
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        # label — funksiya nomi (kodda qat’iy), foydalanuvchi matni emas
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "other")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.labels(name).inc()
+            raise
+        finally:
+            metrics.handler_seconds.labels(name).observe(time.perf_counter() - started)
@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from utils.db import run_db, load_or_create_user, update_user_fields
+from utils.rate_limiter import request_priority, PRIORITY_PREMIUM, PRIORITY_INTERACTIVE
+
+
+# === Foydalanuvchi profili (users qatori) ===
+@dataclass
+class UserProfile:
+    user_id: int
+    username: Optional[str]
+    premium: bool
+    blocked: bool
+    state: Optional[str]
+    subject: Optional[str]
+    grade: Optional[str]
+    free_uses: int
+    _changes: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    @classmethod
+    def from_row(cls, row) -> "UserProfile":
+        user_id, username, premium, blocked, state, subject, grade, free_uses = row
+        return cls(user_id, username, premium == 1, blocked == 1, state, subject, grade, free_uses or 0)
+
+    def __setattr__(self, name, value):
+        # __init__ tugagach qilingan har bir o‘zgarish yozib boriladi
+        if name != "_changes" and "_changes" in self.__dict__ and getattr(self, name) != value:
+            self._changes[name] = int(value) if isinstance(value, bool) else value
+        super().__setattr__(name, value)
+
+    def sync(self, **fields):
+        """Bazada allaqachon yozilgan qiymatlarni profilga qo‘yadi (qayta yozilmaydi)."""
+        for name, value in fields.items():
+            super().__setattr__(name, value)
+
+    def pop_changes(self) -> Dict[str, Any]:
+        changes, self._changes = self._changes, {}
+        return changes
+
+
+# === Middleware: update boshida bitta so‘rov, oxirida bitta UPDATE ===
+class UserContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user: Optional[User] = data.get("event_from_user")
+        if tg_user is None or tg_user.is_bot:
+            return await handler(event, data)
+
+        row = await run_db(load_or_create_user, tg_user.id, tg_user.username)
+        profile = UserProfile.from_row(row)
+        if tg_user.username and profile.username != tg_user.username:
+            profile.username = tg_user.username
+        data["profile"] = profile
+
+        # premium foydalanuvchilarning OpenAI so‘rovlari navbatda oldinga o‘tadi
+        prio_token = request_priority.set(PRIORITY_PREMIUM if profile.premium else PRIORITY_INTERACTIVE)
+        try:
+            return await handler(event, data)
+        finally:
+            request_priority.reset(prio_token)
+            changes = profile.pop_changes()
+            if changes:
+                await run_db(update_user_fields, profile.user_id, changes)
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from utils import db
+
+USER_ID = 1001
+THREADS = 16
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    # har bir oqim db.connect() orqali shu vaqtinchalik bazaga o‘z ulanishini ochadi
+    db._close_local()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    db.migrate()
+    db.add_user(USER_ID, "teacher")
+    db.allow_unlimited(USER_ID, False)
+    yield
+    db._close_local()
+
+
+def _race(func, *args):
+    barrier = threading.Barrier(THREADS)
+    results, lock = [], threading.Lock()
+
+    def worker():
+        try:
+            barrier.wait()
+            result = func(*args)
+            with lock:
+                results.append(result)
+        finally:
+            db._close_local()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _free_uses():
+    return db._fetchone("SELECT free_uses FROM users WHERE user_id=?", (USER_ID,))[0]
+
+
+def test_consume_free_use_grants_exactly_limit(fresh_db):
+    results = _race(db.consume_free_use, USER_ID)
+
+    granted = sorted(r for r in results if r is not None)
+    assert len(results) == THREADS
+    assert granted == list(range(1, db.FREE_USES_LIMIT + 1))  # har bir raqam bir marta
+    assert results.count(None) == THREADS - db.FREE_USES_LIMIT
+    assert _free_uses() == db.FREE_USES_LIMIT
+
+
+def test_refund_free_use_gives_one_back(fresh_db):
+    _race(db.consume_free_use, USER_ID)
+    assert db.consume_free_use(USER_ID) is None
+
+    assert db.refund_free_use(USER_ID) is True
+    assert _free_uses() == db.FREE_USES_LIMIT - 1
+
+    results = _race(db.consume_free_use, USER_ID)
+    assert [r for r in results if r is not None] == [db.FREE_USES_LIMIT]
+    assert _free_uses() == db.FREE_USES_LIMIT
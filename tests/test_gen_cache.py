@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from utils import db, gen_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    db.migrate()
+    db._close_local()
+    labels = ["matematika / 5 / kasrlar", "fizika / 7 / kuch", "tarix / 5 / 100% mustaqillik", "ona_tili / 6 / ot"]
+    for i, label in enumerate(labels):
+        db.cache_put(f"k{i}", "conspect", label, "matn", 0.0)
+    yield
+    db._close_local()
+
+
+def _invalidate(label_part):
+    # run_db — alohida sqlite oqimi; har bir chaqiruv o‘z event loop'ida
+    async def _run():
+        try:
+            return await gen_cache.invalidate(label_part)
+        finally:
+            await db.run_db(db._close_local)  # sqlite oqimining ulanishi keyingi testga o‘tmasin
+    return asyncio.run(_run())
+
+
+def _labels():
+    return sorted(row[0] for row in db._fetchall("SELECT label FROM gen_cache"))
+
+
+@pytest.mark.parametrize("part", ["_", "%", "a_t", "%m"])
+def test_wildcards_match_literally(cache, part):
+    before = _labels()
+    assert _invalidate(part) == sum(part in label for label in before)
+    assert _labels() == [label for label in before if part not in label]
+
+
+def test_substring_is_normalized(cache):
+    assert _invalidate("  Fizika ") == 1
+    assert "fizika / 7 / kuch" not in _labels()
+
+
+def test_empty_after_normalize_removes_nothing(cache):
+    assert _invalidate(" . ") == 0
+    assert len(_labels()) == 4
+
+
+def test_none_clears_everything(cache):
+    assert _invalidate(None) == 4
+    assert _labels() == []
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+from utils.latex_clean import clean_latex
+
+# Golden korpus: har bir <nom>.in.txt uchun kutilgan natija <nom>.out.txt da.
+# Yangi namunalar: botni LATEX_CORPUS_DIR=<papka> bilan ishga tushiring (modelning xom javoblari
+# yoziladi), fayllarni shu yerga ko‘chiring va `python -m utils.latex_clean --golden tests/fixtures/latex`
+# bilan .out.txt yarating. Cleaner o‘zgarsa, .out.txt fayllarini ko‘z bilan tekshirib yangilang.
+FIXTURES = Path(__file__).parent / "fixtures" / "latex"
+CASES = sorted(FIXTURES.glob("*.in.txt"))
+
+
+def test_corpus_not_empty():
+    assert CASES
+
+
+@pytest.mark.parametrize("source", CASES, ids=lambda p: p.name[: -len(".in.txt")])
+def test_clean_latex_golden(source: Path):
+    expected = source.with_name(source.name.replace(".in.txt", ".out.txt"))
+    text = source.read_text(encoding="utf-8")
+    assert clean_latex(text) == expected.read_text(encoding="utf-8").rstrip("\n")
+
+
+@pytest.mark.parametrize("source", CASES, ids=lambda p: p.name[: -len(".in.txt")])
+def test_clean_latex_idempotent(source: Path):
+    once = clean_latex(source.read_text(encoding="utf-8"))
+    assert clean_latex(once) == once
@@ -0,0 +1,37 @@
+import pytest
+
+from utils import db
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    db.migrate()
+    conn = db.connect()
+    yield conn
+    conn.close()
+
+
+def _plan(conn, sql: str, params=()) -> str:
+    return " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql.strip(), params))
+
+
+def test_migrate_sets_latest_version_and_is_idempotent(conn):
+    latest = db.MIGRATIONS[-1][0]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == latest
+    assert db.migrate() == latest
+
+
+# so‘rov → rejada bo‘lishi kerak bo‘lgan indeks (to‘liq SCAN emas)
+@pytest.mark.parametrize("sql, params, expected", [
+    (db._HISTORY_FIRST, (1, 10), "idx_history_user_created (user_id=?)"),
+    (db._HISTORY_OLDER, (1, 2, 1, 10), "idx_history_user_created (user_id=? AND created_at<?)"),
+    (db._HISTORY_NEWER, (1, 2, 1, 10), "idx_history_user_created (user_id=? AND created_at>?)"),
+    (db._PENDING_PAYMENTS, (), "idx_payments_pending"),
+    ("SELECT file_id FROM history WHERE content_hash=? AND file_id IS NOT NULL ORDER BY id DESC LIMIT 1",
+     ("x",), "idx_history_content_hash"),
+], ids=["history_first", "history_older", "history_newer", "pending_payments", "content_hash"])
+def test_query_uses_index(conn, sql, params, expected):
+    plan = _plan(conn, sql, params)
+    assert expected in plan
+    assert "TEMP B-TREE" not in plan  # tartiblash ham indeks bo‘yicha
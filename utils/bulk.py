@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+
+from utils.db import run_db, bulk_get_done, bulk_save_item, bulk_delete
+from utils.openai_api import generate_conspect, is_error_text
+from utils.rate_limiter import request_priority, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+# === Sozlamalar ===
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+BULK_RATE_PER_MIN = float(os.getenv("BULK_RATE_PER_MIN", "30"))
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", "2"))
+BULK_SUBJECT = "Umumiy fan"
+BULK_GRADE = "Har xil sinflar"
+FAILED_TOPIC_TEXT = "❌ Bu mavzu bo‘yicha konspekt yaratilmadi. Faylni qayta yuborsangiz, qayta urinib ko‘riladi."
+
+
+# === Jarayon bo‘yicha umumiy tezlik cheklovi (mavzular orasida teng interval) ===
+class _RateLimiter:
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+_limiter = _RateLimiter(BULK_RATE_PER_MIN)
+
+
+# === Bitta status xabarini cheklangan tezlikda tahrirlash ===
+class _Progress:
+    def __init__(self, message, total: int, resumed: int):
+        self.message = message
+        self.total = total
+        self.resumed = resumed
+        self._last_edit = 0.0
+        self._last_text = None
+
+    async def update(self, done: int, failed: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_edit < BULK_PROGRESS_INTERVAL:
+            return
+        text = f"⏳ Konspektlar: {done}/{self.total} tayyor"
+        if failed:
+            text += f", {failed} ta xato"
+        if self.resumed:
+            text += f"\n♻️ {self.resumed} tasi avvalgi urinishdan tiklandi"
+        if text == self._last_text:
+            return
+        self._last_edit, self._last_text = now, text
+        try:
+            await self.message.edit_text(text)
+        except Exception as e:
+            logger.debug("Progress xabarini tahrirlab bo‘lmadi: %s", e)
+
+
+def make_batch_id(user_id: int, topics: list) -> str:
+    payload = f"{user_id}\0" + "\0".join(topics)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+# === Har bir mavzu alohida ish: cheklangan parallellik + tiklanish ===
+async def generate_bulk(user_id: int, topics: list, progress_message):
+    """
+    Qaytaradi: (batch_id, [(mavzu, matn), ...], xatolar soni).
+    Tayyor mavzular bulk_items jadvalida saqlanadi — xato bo‘lsa,
+    shu faylni qayta yuborish faqat qolgan mavzularni generatsiya qiladi.
+    """
+    batch_id = make_batch_id(user_id, topics)
+    results = await run_db(bulk_get_done, batch_id)
+    failed = set()
+    progress = _Progress(progress_message, len(topics), resumed=len(results))
+    sem = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def job(idx: int, topic: str):
+        # ommaviy ishlar interaktiv so‘rovlardan keyin navbatga turadi
+        request_priority.set(PRIORITY_BULK)
+        async with sem:
+            await _limiter.wait()
+            text = await generate_conspect(BULK_SUBJECT, BULK_GRADE, topic)
+        if is_error_text(text):
+            failed.add(idx)
+            await run_db(bulk_save_item, batch_id, idx, topic, text, "failed")
+        else:
+            results[idx] = text
+            await run_db(bulk_save_item, batch_id, idx, topic, text, "done")
+        await progress.update(len(results), len(failed))
+
+    await progress.update(len(results), 0, force=True)
+    await asyncio.gather(*(job(i, t) for i, t in enumerate(topics) if i not in results))
+    await progress.update(len(results), len(failed), force=True)
+
+    sections = [(t, results.get(i, FAILED_TOPIC_TEXT)) for i, t in enumerate(topics)]
+    return batch_id, sections, len(failed)
+
+
+async def forget_batch(batch_id: str):
+    await run_db(bulk_delete, batch_id)
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# === Sozlamalar ===
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))            # oxirgi N ta chaqiruv
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "60"))  # bundan sekin — muvaffaqiyatsiz
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+BREAKER_MESSAGE = (
+    "❌ Sun’iy intellekt xizmati hozir javob bermayapti. "
+    "Iltimos, bir necha daqiqadan so‘ng qayta urinib ko‘ring."
+)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self):
+        super().__init__(BREAKER_MESSAGE)
+
+
+# === Circuit breaker ===
+class CircuitBreaker:
+    """
+    closed — hammasi o‘tadi; xato/sekin ulushi chegaradan oshsa — open.
+    open — BREAKER_OPEN_SECONDS davomida hammasi darhol rad etiladi.
+    half_open — bir nechta sinov so‘rovi; muvaffaqiyat — closed, xato — yana open.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.on_change = None  # callback(name, old_state, new_state)
+
+    def _set_state(self, new_state: str):
+        old, self.state = self.state, new_state
+        if old == new_state:
+            return
+        logger.warning("Circuit breaker [%s]: %s → %s", self.name, old, new_state)
+        if self.on_change:
+            try:
+                self.on_change(self.name, old, new_state)
+            except Exception as e:
+                logger.debug("on_change xatosi: %s", e)
+
+    def _cooldown_passed(self) -> bool:
+        return time.monotonic() - self._opened_at >= BREAKER_OPEN_SECONDS
+
+    def is_open(self) -> bool:
+        """Yangi ish hozir rad etiladimi (holatni o‘zgartirmaydi)."""
+        return self.state == OPEN and not self._cooldown_passed()
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if not self._cooldown_passed():
+                self.rejected += 1
+                return False
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= BREAKER_HALF_OPEN_PROBES:
+                self.rejected += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, success: bool, latency: float):
+        ok = success and latency <= BREAKER_SLOW_SECONDS
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if ok:
+                self._outcomes.clear()
+                self._set_state(CLOSED)
+            else:
+                self._trip()
+            return
+        self._outcomes.append(ok)
+        if len(self._outcomes) >= BREAKER_MIN_CALLS and self.error_rate() >= BREAKER_ERROR_RATE:
+            self._trip()
+
+    def abandon(self):
+        """Natijasiz tugagan (bekor qilingan) sinov so‘rovi joyini bo‘shatadi."""
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _trip(self):
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def status(self) -> dict:
+        retry_in = max(0.0, BREAKER_OPEN_SECONDS - (time.monotonic() - self._opened_at)) if self.state == OPEN else 0.0
+        return {
+            "state": self.state,
+            "error_rate": self.error_rate(),
+            "calls": len(self._outcomes),
+            "rejected": self.rejected,
+            "retry_in": retry_in,
+        }
+
+
+openai_breaker = CircuitBreaker("openai")
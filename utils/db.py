@@ -1,17 +1,83 @@
-# utils/db.py
+import os
+import time
+import asyncio
 import sqlite3
+import threading
+import functools
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-DB_PATH = "database.db"
+from utils import metrics
 
-def connect():
-    return sqlite3.connect(DB_PATH)
+DB_PATH = os.getenv("DB_PATH", "database.db")
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "8192"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
 
-# === Jadval yaratish ===
-def init_db():
-    conn = connect()
-    cur = conn.cursor()
+# Har bir oqim o‘z doimiy ulanishini saqlaydi; async kod esa bitta
+# ajratilgan "sqlite" oqimi orqali ishlaydi (event loop bloklanmaydi)
+_local = threading.local()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
 
+def connect():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=10,
+        isolation_level=None,  # autocommit: har bir bitta so‘rov o‘zi commit bo‘ladi
+        cached_statements=SQLITE_STATEMENT_CACHE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = connect()
+    return conn
+
+# SQL matnlari o‘zgarmas — sqlite3 tayyorlangan statementlarni keshdan qayta ishlatadi
+def _execute(sql: str, params=()):
+    return _conn().execute(sql, params)
+
+def _fetchone(sql: str, params=()):
+    return _conn().execute(sql, params).fetchone()
+
+def _fetchall(sql: str, params=()):
+    return _conn().execute(sql, params).fetchall()
+
+async def run_db(func, *args, **kwargs):
+    """DB funksiyasini ajratilgan sqlite oqimida bajaradi: `await run_db(is_blocked, uid)`."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        # op — funksiya nomi: kodda qat’iy, so‘rov parametrlari label bo‘lmaydi
+        metrics.sqlite_seconds.labels(getattr(func, "__name__", "other")).observe(time.perf_counter() - started)
+
+def _close_local():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+async def close_db():
+    await run_db(_close_local)
+    _executor.shutdown(wait=True)
+
+def _ensure_column(cur, table: str, column: str, ddl: str):
+    cols = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+# === Sxema migratsiyalari (PRAGMA user_version) ===
+# Har bir qadam bir marta, o‘z tranzaksiyasida bajariladi; yangi o‘zgarish —
+# ro‘yxat oxiriga yangi versiya. Eski qadamlarni tahrirlamang.
+
+def _m001_base_tables(cur):
+    """Boshlang‘ich jadvallar (versiyasiz eski bazalarda ham xavfsiz: IF NOT EXISTS)."""
     # === users jadvali ===
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -25,6 +91,8 @@ def init_db():
         free_uses INTEGER DEFAULT 0
     )
     """)
+    # eski bazalarda free_uses ustuni bo‘lmasligi mumkin
+    _ensure_column(cur, "users", "free_uses", "INTEGER DEFAULT 0")
 
     # === history jadvali ===
     cur.execute("""
@@ -38,6 +106,9 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    # Telegram file_id — qayta yuborishda fayl yuklanmaydi
+    _ensure_column(cur, "history", "file_id", "TEXT")
+    _ensure_column(cur, "history", "content_hash", "TEXT")
 
     # === payments jadvali ===
     cur.execute("""
@@ -62,15 +133,121 @@ def init_db():
     )
     """)
 
-    conn.commit()
-    conn.close()
+    # === gen_cache jadvali (tayyor konspekt/ishlanmalar keshi) ===
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS gen_cache (
+        key TEXT PRIMARY KEY,
+        task TEXT,
+        label TEXT,
+        text TEXT,
+        created_at REAL,
+        last_hit REAL,
+        hits INTEGER DEFAULT 0
+    )
+    """)
+
+    # === bulk_items jadvali (Excel orqali ommaviy generatsiya natijalari) ===
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS bulk_items (
+        batch_id TEXT,
+        idx INTEGER,
+        topic TEXT,
+        text TEXT,
+        status TEXT,
+        PRIMARY KEY (batch_id, idx)
+    )
+    """)
+
+    # === jobs jadvali (qayta ishga tushishdan omon qoladigan generatsiya navbati) ===
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idem_key TEXT UNIQUE,
+        kind TEXT,
+        user_id INTEGER,
+        chat_id INTEGER,
+        payload TEXT,
+        status TEXT DEFAULT 'enqueued',
+        attempts INTEGER DEFAULT 0,
+        max_attempts INTEGER DEFAULT 3,
+        error TEXT,
+        next_run_at REAL,
+        created_at REAL,
+        updated_at REAL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_next ON jobs (status, next_run_at)")
+
+
+def _m002_lookup_indexes(cur):
+    # get_history / get_history_page: WHERE user_id=? ORDER BY created_at DESC, id DESC
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON history (user_id, created_at, id)")
+    # get_file_id_by_hash: faqat yuborilgan (file_id bor) yozuvlar
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_history_content_hash
+        ON history (content_hash) WHERE file_id IS NOT NULL
+    """)
+    # get_pending_payments: kutilayotgan to‘lovlar jadvalning kichik qismi — qisman indeks
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payments_pending
+        ON payments (created_at) WHERE approved = 0
+    """)
+    # last_requests faqat user_id (PRIMARY KEY) bo‘yicha o‘qiladi — qo‘shimcha indeks kerak emas
+
+def _m003_documents(cur):
+    # yaratilgan matn siqilgan holda, sha256 bo‘yicha bir marta saqlanadi (foydalanuvchilar bo‘lishadi)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS documents (
+        text_hash TEXT PRIMARY KEY,
+        codec TEXT,
+        body BLOB,
+        raw_size INTEGER,
+        stored_size INTEGER,
+        created_at REAL
+    )
+    """)
+    _ensure_column(cur, "history", "text_hash", "TEXT")
+    # qayta render uchun sarlavha turi: konspekt / ishlanma
+    _ensure_column(cur, "history", "mode", "TEXT DEFAULT 'konspekt'")
+
+
+MIGRATIONS = [
+    (1, _m001_base_tables),
+    (2, _m002_lookup_indexes),
+    (3, _m003_documents),
+]
+
+def _apply_migrations(conn: sqlite3.Connection) -> int:
+    for version, step in MIGRATIONS:
+        # IMMEDIATE — bir vaqtda ishga tushgan ikkinchi jarayon qadamni takrorlamaydi
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.execute("ROLLBACK")
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate() -> int:
+    """Bazani eng so‘nggi versiyaga keltiradi va versiyani qaytaradi (ishga tushishda bir marta)."""
+    conn = connect()
+    try:
+        return _apply_migrations(conn)
+    finally:
+        conn.close()
+
+def init_db():  # eski nom (skriptlar uchun)
+    return migrate()
 
 
 # === So‘nggi so‘rovni saqlash ===
 def save_last_request(user_id: int, subject: str, grade: str, topic: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("""
+    _execute("""
         INSERT INTO last_requests (user_id, subject, grade, topic, created_at)
         VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET
@@ -79,216 +256,362 @@ def save_last_request(user_id: int, subject: str, grade: str, topic: str):
             topic=excluded.topic,
             created_at=excluded.created_at
     """, (user_id, subject, grade, topic, datetime.now()))
-    conn.commit()
-    conn.close()
 
 def get_last_request(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT subject, grade, topic FROM last_requests WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT subject, grade, topic FROM last_requests WHERE user_id=?", (user_id,))
 
 
 # === Foydalanuvchilar boshqaruvi ===
 def add_user(user_id: int, username: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("""
+    _execute("""
         INSERT OR IGNORE INTO users (user_id, username, premium, blocked, state, subject, grade, free_uses)
         VALUES (?, ?, 0, 0, NULL, NULL, NULL, 0)
     """, (user_id, username))
-    conn.commit()
-    conn.close()
+
+# === Bitta update uchun to‘liq foydalanuvchi yozuvi ===
+USER_COLUMNS = ("user_id", "username", "premium", "blocked", "state", "subject", "grade", "free_uses")
+_USER_SELECT = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id=?"
+_USER_INSERT = f"""
+    INSERT INTO users (user_id, username, premium, blocked, state, subject, grade, free_uses)
+    VALUES (?, ?, 0, 0, NULL, NULL, NULL, 0)
+    ON CONFLICT(user_id) DO NOTHING
+    RETURNING {', '.join(USER_COLUMNS)}
+"""
+
+def load_or_create_user(user_id: int, username: str):
+    """Mavjud foydalanuvchi — bitta SELECT; yangisi — bitta INSERT ... RETURNING."""
+    row = _fetchone(_USER_SELECT, (user_id,))
+    if row is None:
+        row = _fetchone(_USER_INSERT, (user_id, username)) or _fetchone(_USER_SELECT, (user_id,))
+    return row
+
+def update_user_fields(user_id: int, fields: dict):
+    """O‘zgargan ustunlarni bitta UPDATE bilan yozadi."""
+    cols = [c for c in fields if c in USER_COLUMNS and c != "user_id"]
+    if not cols:
+        return
+    sql = f"UPDATE users SET {', '.join(f'{c}=?' for c in cols)} WHERE user_id=?"
+    _execute(sql, (*[fields[c] for c in cols], user_id))
 
 def get_all_users():
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, username, premium, blocked, free_uses FROM users")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall("SELECT user_id, username, premium, blocked, free_uses FROM users")
 
 def get_users_count():
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM users")
-    count = cur.fetchone()[0]
-    conn.close()
-    return count
+    return _fetchone("SELECT COUNT(*) FROM users")[0]
 
 def is_premium(user_id: int) -> bool:
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT premium FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT premium FROM users WHERE user_id=?", (user_id,))
     return row and row[0] == 1
 
 def set_premium(user_id: int, status: int = 1):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET premium=? WHERE user_id=?", (status, user_id))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET premium=? WHERE user_id=?", (status, user_id))
+    allow_unlimited(user_id, bool(status))
 
 def block_user(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET blocked=1 WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET blocked=1 WHERE user_id=?", (user_id,))
 
 def unblock_user(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET blocked=0 WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET blocked=0 WHERE user_id=?", (user_id,))
 
 def is_blocked(user_id: int) -> bool:
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT blocked FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT blocked FROM users WHERE user_id=?", (user_id,))
     return row and row[0] == 1
 
 def get_blocked_users():
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, username FROM users WHERE blocked=1")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall("SELECT user_id, username FROM users WHERE blocked=1")
 
 
 # === Holat boshqaruvi ===
 def set_state(user_id: int, state: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET state=? WHERE user_id=?", (state, user_id))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET state=? WHERE user_id=?", (state, user_id))
 
 def get_state(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT state FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT state FROM users WHERE user_id=?", (user_id,))
     return row[0] if row else None
 
 
 # === Fan / sinf boshqaruvi ===
 def set_subject(user_id: int, subject: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET subject=? WHERE user_id=?", (subject, user_id))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET subject=? WHERE user_id=?", (subject, user_id))
 
 def get_subject(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT subject FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT subject FROM users WHERE user_id=?", (user_id,))
     return row[0] if row else None
 
 def set_grade(user_id: int, grade: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET grade=? WHERE user_id=?", (grade, user_id))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE users SET grade=? WHERE user_id=?", (grade, user_id))
 
 def get_grade(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT grade FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT grade FROM users WHERE user_id=?", (user_id,))
     return row[0] if row else None
 
 
 # === Tarix boshqaruvi ===
-def save_history(user_id: int, subject: str, grade: str, topic: str, file_path: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO history (user_id, subject, grade, topic, file_path)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, subject, grade, topic, file_path))
-    conn.commit()
-    conn.close()
+def save_history(user_id: int, subject: str, grade: str, topic: str, file_path: str,
+                 file_id: str = None, content_hash: str = None, text_hash: str = None,
+                 mode: str = "konspekt"):
+    _execute("""
+        INSERT INTO history (user_id, subject, grade, topic, file_path, file_id, content_hash, text_hash, mode)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, subject, grade, topic, file_path, file_id, content_hash, text_hash, mode))
+
+def set_history_file_id(entry_id: int, file_id: str):
+    _execute("UPDATE history SET file_id=? WHERE id=?", (file_id, entry_id))
 
 def get_history(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM history WHERE user_id=? ORDER BY created_at DESC", (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall("SELECT * FROM history WHERE user_id=? ORDER BY created_at DESC", (user_id,))
+
+def get_history_entry(user_id: int, entry_id: int):
+    return _fetchone("""
+        SELECT id, subject, grade, topic, file_id, content_hash, text_hash, mode
+        FROM history WHERE id=? AND user_id=?
+    """, (entry_id, user_id))
+
+# === Tarix sahifalari (keyset: created_at, id) ===
+# Kursor — sahifa chetidagi yozuv id si; uning (created_at, id) qiymati PRIMARY KEY
+# orqali olinadi, sahifaning o‘zi idx_history_user_created bo‘yicha bitta diapazon.
+_HISTORY_FIRST = """
+    SELECT id, subject, topic FROM history
+    WHERE user_id=? ORDER BY created_at DESC, id DESC LIMIT ?
+"""
+_HISTORY_OLDER = """
+    SELECT id, subject, topic FROM history
+    WHERE user_id=? AND (created_at, id) < (SELECT created_at, id FROM history WHERE id=? AND user_id=?)
+    ORDER BY created_at DESC, id DESC LIMIT ?
+"""
+_HISTORY_NEWER = """
+    SELECT id, subject, topic FROM history
+    WHERE user_id=? AND (created_at, id) > (SELECT created_at, id FROM history WHERE id=? AND user_id=?)
+    ORDER BY created_at, id LIMIT ?
+"""
+
+def get_history_page(user_id: int, limit: int = 10, before_id: int = None, after_id: int = None):
+    """
+    (rows, has_older, has_newer) — rows: (id, subject, topic), eng yangisi birinchi.
+    before_id — shu yozuvdan eskilari, after_id — shu yozuvdan yangilari, ikkalasi yo‘q — birinchi sahifa.
+    """
+    if after_id is not None:
+        rows = _fetchall(_HISTORY_NEWER, (user_id, after_id, user_id, limit + 1))
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return rows, True, has_newer
+    if before_id is not None:
+        rows = _fetchall(_HISTORY_OLDER, (user_id, before_id, user_id, limit + 1))
+    else:
+        rows = _fetchall(_HISTORY_FIRST, (user_id, limit + 1))
+    return rows[:limit], len(rows) > limit, before_id is not None
+
+def get_file_id_by_hash(content_hash: str):
+    row = _fetchone("""
+        SELECT file_id FROM history
+        WHERE content_hash=? AND file_id IS NOT NULL
+        ORDER BY id DESC LIMIT 1
+    """, (content_hash,))
+    return row[0] if row else None
 
 
 # === To‘lov boshqaruvi ===
 def add_payment(user_id: int, username: str, photo_id: str):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("""
+    cur = _execute("""
         INSERT INTO payments (user_id, username, photo_id, approved, created_at)
         VALUES (?, ?, ?, 0, ?)
     """, (user_id, username, photo_id, datetime.now()))
-    payment_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return payment_id
+    return cur.lastrowid
+
+_PENDING_PAYMENTS = "SELECT * FROM payments WHERE approved=0 ORDER BY created_at"
 
 def get_pending_payments():
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM payments WHERE approved=0")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall(_PENDING_PAYMENTS)
 
 def get_payment_by_id(payment_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT id, user_id, username, photo_id, approved, created_at FROM payments WHERE id=?", (payment_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT id, user_id, username, photo_id, approved, created_at FROM payments WHERE id=?", (payment_id,))
 
 def approve_payment(payment_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE payments SET approved=1 WHERE id=?", (payment_id,))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE payments SET approved=1 WHERE id=?", (payment_id,))
 
 def reject_payment(payment_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE payments SET approved=-1 WHERE id=?", (payment_id,))
-    conn.commit()
-    conn.close()
+    _execute("UPDATE payments SET approved=-1 WHERE id=?", (payment_id,))
 
 
 # === Bepul foydalanish ===
 def get_free_uses(user_id: int) -> int:
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT free_uses FROM users WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _fetchone("SELECT free_uses FROM users WHERE user_id=?", (user_id,))
     return row[0] if row else 0
 
-def increment_free_use(user_id: int):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET free_uses = free_uses + 1 WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+
+# === Bepul foydalanish kvotasi: tekshiruv va sarflash bitta shartli UPDATE da ===
+FREE_USES_LIMIT = int(os.getenv("FREE_USES_LIMIT", "3"))
+
+# premium/admin — jarayon ichida keshlanadi, ular uchun kvota so‘rovi yuborilmaydi
+_unlimited_users = set()
+
+def allow_unlimited(user_id: int, status: bool = True):
+    if status:
+        _unlimited_users.add(user_id)
+    else:
+        _unlimited_users.discard(user_id)
+
+def consume_free_use(user_id: int, limit: int = FREE_USES_LIMIT):
+    """
+    0 — cheklovsiz (premium/admin), 1..limit — hozir sarflangan bepul imkoniyat raqami,
+    None — imkoniyat tugagan. Ikki parallel so‘rov bir xil imkoniyatni ikki marta ololmaydi.
+    """
+    if user_id in _unlimited_users:
+        return 0
+    row = _fetchone("""
+        UPDATE users SET free_uses = free_uses + (premium = 0)
+        WHERE user_id = ? AND (premium = 1 OR free_uses < ?)
+        RETURNING premium, free_uses
+    """, (user_id, limit))
+    if row is None:
+        return None
+    premium, used = row
+    if premium == 1:
+        _unlimited_users.add(user_id)
+        return 0
+    return used
+
+def refund_free_use(user_id: int) -> bool:
+    """Generatsiya muvaffaqiyatsiz bo‘lsa, sarflangan imkoniyat qaytariladi."""
+    if user_id in _unlimited_users:
+        return False
+    return _execute("""
+        UPDATE users SET free_uses = free_uses - 1 WHERE user_id = ? AND premium = 0 AND free_uses > 0
+    """, (user_id,)).rowcount == 1
+
+def reset_free_uses(user_id: int, limit: int = FREE_USES_LIMIT):
+    """Limit tugagan bo‘lsa, hisoblagich nolga tushadi (to‘lov tasdiqlanganda)."""
+    _execute("UPDATE users SET free_uses = 0 WHERE user_id = ? AND free_uses >= ?", (user_id, limit))
+
+
+# === Generatsiya keshi ===
+def cache_get(key: str, min_created: float, now: float):
+    row = _fetchone("""
+        UPDATE gen_cache SET hits = hits + 1, last_hit = ?
+        WHERE key = ? AND created_at >= ?
+        RETURNING text
+    """, (now, key, min_created))
+    return row[0] if row else None
+
+def cache_put(key: str, task: str, label: str, text: str, now: float):
+    _execute("""
+        INSERT INTO gen_cache (key, task, label, text, created_at, last_hit, hits)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+        ON CONFLICT(key) DO UPDATE SET
+            text=excluded.text,
+            created_at=excluded.created_at,
+            last_hit=excluded.last_hit
+    """, (key, task, label, text, now, now))
+
+def cache_evict(min_created: float, max_entries: int) -> int:
+    removed = _execute("DELETE FROM gen_cache WHERE created_at < ?", (min_created,)).rowcount
+    removed += _execute("""
+        DELETE FROM gen_cache WHERE key IN (
+            SELECT key FROM gen_cache ORDER BY last_hit DESC LIMIT -1 OFFSET ?
+        )
+    """, (max_entries,)).rowcount
+    return removed
+
+def cache_invalidate(label_part: str = None) -> int:
+    if not label_part:
+        return _execute("DELETE FROM gen_cache").rowcount
+    # instr — oddiy qism-satr: LIKE dagi "%"/"_" model nomi yoki matnda boshqa yozuvlarni ham o‘chirardi
+    return _execute("DELETE FROM gen_cache WHERE instr(label, ?) > 0", (label_part,)).rowcount
+
+def cache_count() -> int:
+    return _fetchone("SELECT COUNT(*) FROM gen_cache")[0]
+
+
+# === Hujjat matnlari (siqilgan, kontent-manzilli) ===
+def doc_put(text_hash: str, codec: str, body: bytes, raw_size: int, now: float) -> bool:
+    """Yangi matn bo‘lsa True; bir xil matn ikkinchi marta yozilmaydi."""
+    return _execute("""
+        INSERT INTO documents (text_hash, codec, body, raw_size, stored_size, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(text_hash) DO NOTHING
+    """, (text_hash, codec, body, raw_size, len(body), now)).rowcount > 0
+
+def doc_get(text_hash: str):
+    """(codec, body) yoki None."""
+    return _fetchone("SELECT codec, body FROM documents WHERE text_hash=?", (text_hash,))
+
+def doc_storage_stats() -> dict:
+    documents, raw, stored = _fetchone("""
+        SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM documents
+    """)
+    # har bir tarix yozuvi o‘z nusxasini siqmasdan saqlaganda ketadigan hajm
+    entries, logical = _fetchone("""
+        SELECT COUNT(*), COALESCE(SUM(d.raw_size), 0)
+        FROM history h JOIN documents d ON d.text_hash = h.text_hash
+    """)
+    return {"documents": documents, "entries": entries, "raw": raw, "stored": stored, "logical": logical}
+
+
+# === Ommaviy (Excel) generatsiya holati ===
+def bulk_get_done(batch_id: str) -> dict:
+    rows = _fetchall("SELECT idx, text FROM bulk_items WHERE batch_id=? AND status='done'", (batch_id,))
+    return {idx: text for idx, text in rows}
+
+def bulk_save_item(batch_id: str, idx: int, topic: str, text: str, status: str):
+    _execute("""
+        INSERT INTO bulk_items (batch_id, idx, topic, text, status)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(batch_id, idx) DO UPDATE SET text=excluded.text, status=excluded.status
+    """, (batch_id, idx, topic, text, status))
+
+def bulk_delete(batch_id: str):
+    _execute("DELETE FROM bulk_items WHERE batch_id=?", (batch_id,))
+
+
+# === Generatsiya ishlari navbati (jobs) ===
+def job_enqueue(idem_key: str, kind: str, user_id: int, chat_id: int, payload: str,
+                max_attempts: int, now: float):
+    """(job_id, yangi_mi). Bir xil idem_key ikkinchi marta navbatga qo‘shilmaydi."""
+    row = _fetchone("""
+        INSERT INTO jobs (idem_key, kind, user_id, chat_id, payload, status, max_attempts,
+                          next_run_at, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, 'enqueued', ?, ?, ?, ?)
+        ON CONFLICT(idem_key) DO NOTHING
+        RETURNING id
+    """, (idem_key, kind, user_id, chat_id, payload, max_attempts, now, now, now))
+    if row:
+        return row[0], True
+    return _fetchone("SELECT id FROM jobs WHERE idem_key=?", (idem_key,))[0], False
+
+def job_claim(now: float):
+    """Vaqti kelgan eng eski ishni 'running' qiladi va qaytaradi (yoki None)."""
+    return _fetchone("""
+        UPDATE jobs SET status='running', attempts=attempts+1, updated_at=?
+        WHERE id = (
+            SELECT id FROM jobs WHERE status='enqueued' AND next_run_at <= ?
+            ORDER BY next_run_at, id LIMIT 1
+        )
+        RETURNING id, kind, user_id, chat_id, payload, attempts, max_attempts
+    """, (now, now))
+
+def job_next_due():
+    row = _fetchone("SELECT MIN(next_run_at) FROM jobs WHERE status='enqueued'")
+    return row[0] if row else None
+
+def job_finish(job_id: int, status: str, error: str, now: float):
+    _execute("UPDATE jobs SET status=?, error=?, updated_at=? WHERE id=?", (status, error, now, job_id))
+
+def job_retry(job_id: int, error: str, run_at: float, now: float):
+    _execute("""
+        UPDATE jobs SET status='enqueued', error=?, next_run_at=?, updated_at=? WHERE id=?
+    """, (error, run_at, now, job_id))
+
+def job_requeue_running(now: float) -> int:
+    """Jarayon to‘xtaganda chala qolgan ishlar qayta navbatga qaytadi."""
+    return _execute("""
+        UPDATE jobs SET status='enqueued', next_run_at=?, updated_at=? WHERE status='running'
+    """, (now, now)).rowcount
+
+def job_cleanup(older_than: float) -> int:
+    return _execute("""
+        DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?
+    """, (older_than,)).rowcount
+
+def job_counts() -> dict:
+    return dict(_fetchall("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
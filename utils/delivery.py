@@ -0,0 +1,69 @@
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+
+from utils.db import run_db, save_history, set_history_file_id, get_file_id_by_hash
+from utils.docx_generator import named_docx_meta, content_digest, render_named_docx
+from utils.doc_store import store_text, load_text
+
+logger = logging.getLogger(__name__)
+
+
+# === Hujjatni yuborish: avval Telegram file_id, bo‘lmasa render + yuklash ===
+async def send_generated_docx(bot: Bot, chat_id: int, user_id: int, text: str,
+                              subject: str, grade: str, topic: str,
+                              mode: str = "konspekt", caption: str = None):
+    """
+    Bir xil matn+sarlavha uchun hujjat bir marta yuklanadi; keyingi
+    yuborishlar (kesh hit, qayta yuklab olish) file_id orqali — 0 bayt.
+    """
+    _, title = named_docx_meta(subject, topic, mode)
+    digest = content_digest(text, title)
+    file_path = None
+
+    file_id = await run_db(get_file_id_by_hash, digest)
+    sent = None
+    if file_id:
+        try:
+            sent = await bot.send_document(chat_id, file_id, caption=caption)
+        except TelegramBadRequest as e:
+            logger.warning("file_id eskirgan (%s), qayta yuklanadi: %s", digest[:12], e)
+
+    if sent is None:
+        docx = await render_named_docx(text, subject, topic, mode)
+        sent = await bot.send_document(chat_id, BufferedInputFile(docx.data, docx.filename), caption=caption)
+        file_path = docx.stored_path or docx.filename
+
+    file_id = sent.document.file_id if sent.document else file_id
+    # matn siqilib saqlanadi — file_id eskirsa ham hujjat qayta generatsiyasiz tiklanadi
+    text_hash = await store_text(text)
+    await run_db(save_history, user_id, subject, grade, topic, file_path, file_id, digest, text_hash, mode)
+    return sent
+
+
+# === Tarixdagi hujjatni qayta yuborish (faqat file_id) ===
+async def resend_by_file_id(bot: Bot, chat_id: int, file_id: str, caption: str = None) -> bool:
+    try:
+        await bot.send_document(chat_id, file_id, caption=caption)
+        return True
+    except TelegramBadRequest as e:
+        logger.warning("Tarixdagi file_id yuborilmadi: %s", e)
+        return False
+
+
+# === Tarix yozuvini qayta yuborish: file_id, bo‘lmasa saqlangan matndan qayta render ===
+async def resend_history_entry(bot: Bot, chat_id: int, entry) -> bool:
+    entry_id, subject, grade, topic, file_id, content_hash, text_hash, mode = entry
+    caption = f"📄 {subject} — {topic}"
+    if file_id and await resend_by_file_id(bot, chat_id, file_id, caption=caption):
+        return True
+    text = await load_text(text_hash) if text_hash else None
+    if text is None:
+        return False
+    docx = await render_named_docx(text, subject, topic, mode or "konspekt")
+    sent = await bot.send_document(chat_id, BufferedInputFile(docx.data, docx.filename), caption=caption)
+    if sent.document:
+        await run_db(set_history_file_id, entry_id, sent.document.file_id)
+    return True
@@ -0,0 +1,59 @@
+import os
+import time
+import zlib
+import hashlib
+import logging
+from typing import Optional
+
+from utils.db import run_db, doc_put, doc_get, doc_storage_stats
+
+logger = logging.getLogger(__name__)
+
+# === Sozlamalar ===
+# 6 — zlib standarti; konspekt matnida 9 deyarli foyda bermaydi, lekin sekinroq
+DOC_COMPRESS_LEVEL = int(os.getenv("DOC_COMPRESS_LEVEL", "6"))
+CODEC = "zlib"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(text: str):
+    raw = text.encode("utf-8")
+    return text_hash(text), zlib.compress(raw, DOC_COMPRESS_LEVEL), len(raw)
+
+
+def _unpack(codec: str, body: bytes) -> str:
+    if codec != CODEC:
+        raise ValueError(f"Noma’lum kodek: {codec}")
+    return zlib.decompress(body).decode("utf-8")
+
+
+# === Asosiy API ===
+async def store_text(text: str) -> str:
+    """Matnni siqib saqlaydi va uning hashini qaytaradi (bir xil matn bir marta yoziladi)."""
+    def _store():
+        digest, body, raw_size = _pack(text)
+        doc_put(digest, CODEC, body, raw_size, time.time())
+        return digest
+    return await run_db(_store)
+
+
+async def load_text(digest: str) -> Optional[str]:
+    row = await run_db(doc_get, digest)
+    if row is None:
+        return None
+    try:
+        return _unpack(*row)
+    except (ValueError, zlib.error) as e:
+        logger.warning("Saqlangan matn o‘qilmadi (%s): %s", digest[:12], e)
+        return None
+
+
+async def storage_report() -> dict:
+    """Hajmlar baytda; saved — tarixdagi har bir yozuv alohida, siqilmasdan saqlanganiga nisbatan."""
+    stats = await run_db(doc_storage_stats)
+    stats["saved"] = max(0, stats["logical"] - stats["stored"])
+    stats["ratio"] = stats["stored"] / stats["raw"] if stats["raw"] else 1.0
+    return stats
@@ -1,74 +1,255 @@
 # utils/docx_generator.py
+import io
 import os
 import re
+import copy
+import time
+import asyncio
+import hashlib
+import threading
+from typing import NamedTuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 from docx.shared import Pt, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from utils import metrics
+from utils.singleflight import SingleFlight
+
+# bo‘sh bo‘lsa fayllar diskka umuman yozilmaydi
+DOCX_STORE_DIR = os.getenv("DOCX_STORE_DIR", "").strip()
+DOCX_WORKERS = int(os.getenv("DOCX_WORKERS", "2"))
+# ixtiyoriy: o‘z shriftlari/sahifa sozlamalari bilan .docx shablon
+DOCX_TEMPLATE = os.getenv("DOCX_TEMPLATE", "").strip()
+
+_pool = ThreadPoolExecutor(max_workers=DOCX_WORKERS, thread_name_prefix="docx")
+_docx_flight = SingleFlight("docx")
+
+
+class DocxFile(NamedTuple):
+    filename: str
+    data: bytes
+    digest: str  # sarlavha + matn bo‘yicha sha256 (kontent manzili)
+    stored_path: Optional[str] = None
+
 # === Fayl nomini xavfsiz qilish ===
 def _sanitize_filename(text: str) -> str:
     safe = re.sub(r"[^\w\- ]+", "", text, flags=re.UNICODE).strip().replace(" ", "_")
     return safe or "konspekt"
 
-# === Asosiy DOCX yaratish ===
-def create_docx(text: str, filename: str = "konspekt.docx", title: str = None):
+def _safe_docx_name(filename: str) -> str:
     safe_filename = _sanitize_filename(os.path.splitext(filename)[0]) + ".docx"
     if len(safe_filename) > 100:
         safe_filename = safe_filename[:100] + ".docx"
+    return safe_filename
+
+def content_digest(text: str, title: str = None) -> str:
+    return hashlib.sha256(f"{title or ''}\0{text}".encode("utf-8")).hexdigest()
+
+def _to_bytes(doc) -> bytes:
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
 
-    doc = Document()
+# === Shablon: nomlangan uslublar bir marta yaratiladi, har render shu baytlardan boshlanadi ===
+STYLE_TITLE = "Konspekt Title"
+STYLE_HEADING = "Konspekt Heading"
+STYLE_BODY = "Konspekt Body"
 
-    # === Sarlavha ===
+def _ensure_style(doc, name: str, size: int, bold: bool = False, color=None, align=None,
+                  space_before: int = 0, space_after: int = 0):
+    styles = doc.styles
+    if name in [s.name for s in styles]:
+        return
+    style = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+    style.base_style = styles["Normal"]
+    style.font.size = Pt(size)
+    style.font.bold = bold
+    if color:
+        style.font.color.rgb = RGBColor(*color)
+    fmt = style.paragraph_format
+    if align is not None:
+        fmt.alignment = align
+    fmt.space_before = Pt(space_before)
+    fmt.space_after = Pt(space_after)
+
+def _build_template() -> bytes:
+    doc = Document(DOCX_TEMPLATE or None)
+    # sarlavhadan keyingi bo‘sh paragraflar o‘rniga uslubdagi oraliq
+    _ensure_style(doc, STYLE_TITLE, 16, bold=True, color=(0, 51, 153), align=WD_ALIGN_PARAGRAPH.CENTER, space_after=14)
+    _ensure_style(doc, STYLE_HEADING, 14, bold=True, align=WD_ALIGN_PARAGRAPH.LEFT, space_before=6, space_after=14)
+    _ensure_style(doc, STYLE_BODY, 12, color=(40, 40, 40), space_after=4)
+    return _to_bytes(doc)
+
+# shablon, uslub id lari va paragraf prototiplari birinchi renderda, lock ostida birga
+# tayyorlanadi: _pool oqimlari ularni yarim to‘lgan holda ko‘rmasligi kerak
+_template: Optional[bytes] = None
+_style_ids = {}
+_prototypes = {}
+_template_lock = threading.Lock()
+
+def _load_template() -> bytes:
+    global _template
+    if _template is not None:
+        return _template
+    with _template_lock:
+        if _template is None:
+            data = _build_template()
+            doc = Document(io.BytesIO(data))
+            for name in (STYLE_TITLE, STYLE_HEADING, STYLE_BODY):
+                style_id = doc.styles[name].style_id
+                _style_ids[name] = style_id
+                for empty in (False, True):
+                    _prototypes[(style_id, empty)] = _prototype(style_id, empty)
+            _template = data  # oxirida — boshqa oqimlar faqat to‘liq holatni ko‘radi
+    return _template
+
+def _new_document():
+    return Document(io.BytesIO(_load_template()))
+
+# === Asosiy DOCX (xotirada) ===
+def render_docx(text: str, title: str = None) -> bytes:
+    doc = _new_document()
     if title:
-        title_p = doc.add_paragraph(title)
-        title_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = title_p.runs[0]
-        run.bold = True
-        run.font.size = Pt(16)
-        run.font.color.rgb = RGBColor(0, 51, 153)
-        doc.add_paragraph("")
-
-    # === Asosiy matn ===
-    # Belgilarni tozalaymiz
-    clean_text = re.sub(r"[*_#]+", "", text)
-    lines = clean_text.splitlines()
-
-    for line in lines:
+        _append_paragraphs(doc, [(STYLE_TITLE, title)])
+    _add_body(doc, text)
+    return _to_bytes(doc)
+
+# === Diskka yozuvchi eski interfeys (skriptlar uchun) ===
+def create_docx(text: str, filename: str = "konspekt.docx", title: str = None):
+    safe_filename = _safe_docx_name(filename)
+    with open(safe_filename, "wb") as f:
+        f.write(render_docx(text, title))
+    return safe_filename
+
+# === Qatorlarni tasniflash (oldindan kompilyatsiya qilingan naqshlar) ===
+_MARKUP = re.compile(r"[*_#]+")
+_HEADING = re.compile(
+    r"\d+[.)]\s"
+    r"|(?:Mavzu|Maqsad|Ta’limiy|Tarbiyaviy|Rivojlantiruvchi|Jihoz|Metodik|Darsning|Yangi|Asosiy"
+    r"|Mustahkamlash|Baholash|Uyga vazifa|Kutilayotgan)"
+)
+
+def _classify(text: str):
+    """(uslub, qator) juftliklari; bo‘sh qator — bo‘sh paragraf."""
+    for line in _MARKUP.sub("", text).splitlines():
         line = line.strip()
         if not line:
-            doc.add_paragraph("")
-            continue
-
-        # Sarlavha yoki kichik bo‘limni aniqlash
-        is_heading = bool(
-            re.match(r"^\d+[\.\)]\s", line)
-            or re.match(r"^(Mavzu|Maqsad|Ta’limiy|Tarbiyaviy|Rivojlantiruvchi|Jihoz|Metodik|Darsning|Yangi|Asosiy|Mustahkamlash|Baholash|Uyga vazifa|Kutilayotgan)", line)
-            or line.endswith(":")
-        )
-
-        p = doc.add_paragraph()
-        run = p.add_run(line)
-        if is_heading:
-            run.bold = True
-            run.font.size = Pt(14)
-            p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-            doc.add_paragraph("")  # har sarlavhadan keyin bo‘sh qator
+            yield STYLE_BODY, ""
+        elif line.endswith(":") or _HEADING.match(line):
+            yield STYLE_HEADING, line
         else:
-            run.font.size = Pt(12)
-            run.font.color.rgb = RGBColor(40, 40, 40)
+            yield STYLE_BODY, line
 
-    doc.save(safe_filename)
-    return safe_filename
+# === Paragraflarni to‘g‘ridan-to‘g‘ri XML ga qo‘shish (bitta o‘tish) ===
+def _prototype(style_id: str, empty: bool):
+    run = "" if empty else '<w:r><w:t xml:space="preserve"></w:t></w:r>'
+    return parse_xml(
+        f'<w:p {nsdecls("w")}><w:pPr><w:pStyle w:val="{escape(style_id)}"/></w:pPr>{run}</w:p>'
+    )
+
+def _append_paragraphs(doc, items):
+    body = doc.element.body
+    anchor = body.sectPr  # paragraflar sahifa sozlamalaridan oldin turishi kerak
+    for style, line in items:
+        p = copy.deepcopy(_prototypes[(_style_ids[style], not line)])
+        if line:
+            p[-1][-1].text = line
+        if anchor is not None:
+            anchor.addprevious(p)
+        else:
+            body.append(p)
+
+def _add_body(doc, text: str):
+    _append_paragraphs(doc, _classify(text))
+
+# === Ommaviy hujjat: har bir mavzu alohida sarlavha bilan ===
+def render_bulk_docx(sections, title: str = "Yig‘ma Konspekt") -> bytes:
+    """sections — (mavzu, matn) juftliklari ro‘yxati, tartib saqlanadi."""
+    doc = _new_document()
+    _append_paragraphs(doc, [(STYLE_TITLE, title)])
+    for i, (topic, text) in enumerate(sections, 1):
+        _append_paragraphs(doc, [(STYLE_HEADING, f"{i}. {topic}")])
+        _add_body(doc, text)
+    return _to_bytes(doc)
+
+# === Ixtiyoriy kontent-manzilli saqlash (DOCX_STORE_DIR) ===
+def persist_docx(data: bytes, digest: str) -> Optional[str]:
+    if not DOCX_STORE_DIR:
+        return None
+    os.makedirs(DOCX_STORE_DIR, exist_ok=True)
+    path = os.path.join(DOCX_STORE_DIR, f"{digest}.docx")
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return path
 
-# === Foydalanuvchi nomiga mos fayl yaratish ===
-def create_named_docx(text: str, subject: str, topic: str, user_id: int, mode: str = "konspekt"):
+# === Fan/mavzuga mos fayl nomi ===
+# file_id kontent hash bo‘yicha foydalanuvchilar orasida qayta ishlatiladi — nomda user_id bo‘lmaydi
+def named_docx_meta(subject: str, topic: str, mode: str = "konspekt"):
     topic_clean = "Kop_mavzular" if "\n" in topic or len(topic) > 50 else _sanitize_filename(topic)
-    base_name = f"{user_id}_{_sanitize_filename(subject)}_{topic_clean}_{mode}.docx"
+    filename = _safe_docx_name(f"{_sanitize_filename(subject)}_{topic_clean}_{mode}.docx")
     title = f"{subject} — {topic}" if mode == "konspekt" else f"{subject} — {topic} — Dars ishlanma"
-    return create_docx(text, filename=base_name, title=title)
+    return filename, title
+
+def create_named_docx(text: str, subject: str, topic: str, mode: str = "konspekt") -> DocxFile:
+    filename, title = named_docx_meta(subject, topic, mode)
+    digest = content_digest(text, title)
+    data = render_docx(text, title)
+    return DocxFile(filename, data, digest, persist_docx(data, digest))
+
+# === Async: python-docx ishi alohida thread pool'da ===
+async def _in_pool(func, *args, timer=None):
+    started = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+    if timer is not None:
+        # event loop da yoziladi — pool oqimlari metrikaga tegmaydi
+        timer.observe(time.perf_counter() - started)
+    return result
+
+async def render_named_docx(text: str, subject: str, topic: str, mode: str = "konspekt") -> DocxFile:
+    """Bir xil matn bir marta render qilinadi; parallel so‘rovlar baytlarni bo‘lishadi."""
+    filename, title = named_docx_meta(subject, topic, mode)
+    digest = content_digest(text, title)
+
+    def _render():
+        data = render_docx(text, title)
+        return data, persist_docx(data, digest)
+
+    data, stored_path = await _docx_flight.do(digest, lambda: _in_pool(_render, timer=metrics.DOCX_SINGLE))
+    return DocxFile(filename, data, digest, stored_path)
+
+async def render_bulk_docx_async(sections, user_id: int) -> DocxFile:
+    data = await _in_pool(render_bulk_docx, sections, timer=metrics.DOCX_BULK)
+    digest = hashlib.sha256(data).hexdigest()
+    return DocxFile(_safe_docx_name(f"{user_id}_yigma_konspekt.docx"), data, digest)
 
 # === Preview (20%) ===
 def get_preview(text: str, percent: int = 20):
     lines = text.splitlines()
     preview_len = max(1, len(lines) * percent // 100)
     return "\n".join(lines[:preview_len])
+
+
+# === Benchmark: python -m utils.docx_generator ===
+if __name__ == "__main__":
+    block = [
+        "5. Yangi mavzu bayoni:",
+        "O‘qituvchi yangi tushunchani misollar bilan tushuntiradi, o‘quvchilar daftarga yozib boradi.",
+        "Misol: 2x² - 3x + 1 = 0, D = 9 - 8 = 1.",
+        "- Guruhlarda ishlash: har bir guruh bittadan masala yechadi.",
+        "",
+    ]
+    for lines in (1000, 5000, 10000):
+        text = "\n".join(block * (lines // len(block)))
+        render_docx(text, "Benchmark")  # shablon va prototiplar tayyorlanadi
+        started = time.perf_counter()
+        data = render_docx(text, "Benchmark")
+        elapsed = time.perf_counter() - started
+        print(f"{lines:>6} qator: {elapsed * 1000:8.1f} ms, {len(data) // 1024} KB")
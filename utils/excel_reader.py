@@ -0,0 +1,95 @@
+import io
+import os
+import csv
+import asyncio
+
+from utils.tokens import estimate_tokens, split_topic, MAX_TOPIC_TOKENS
+
+# === Cheklovlar ===
+TOPICS_MAX_BYTES = int(os.getenv("TOPICS_MAX_BYTES", str(5 * 1024 * 1024)))
+TOPICS_MAX_ROWS = int(os.getenv("TOPICS_MAX_ROWS", "200"))
+TOPIC_COLUMN = "mavzu"
+SUPPORTED_EXTENSIONS = (".xlsx", ".xlsm", ".csv")
+
+
+class TopicFileError(ValueError):
+    """Foydalanuvchiga ko‘rsatiladigan fayl xatosi."""
+
+
+def _column_index(header) -> int:
+    for i, cell in enumerate(header or ()):
+        if cell is not None and str(cell).strip().casefold() == TOPIC_COLUMN:
+            return i
+    raise TopicFileError("❌ Faylda 'Mavzu' nomli ustun topilmadi.")
+
+
+def _collect(rows) -> list:
+    """Sarlavhadan keyingi qatorlardan faqat 'Mavzu' ustunini oqim tarzida o‘qiydi."""
+    rows = iter(rows)
+    col = _column_index(next(rows, None))
+    topics = []
+    for row_no, row in enumerate(rows, start=2):
+        if col >= len(row) or row[col] is None:
+            continue
+        topic = str(row[col]).strip()
+        if not topic:
+            continue
+        for part in _fit_topic(topic, row_no):
+            if len(topics) >= TOPICS_MAX_ROWS:
+                raise TopicFileError(f"❌ Fayldagi mavzular juda ko‘p (maksimum {TOPICS_MAX_ROWS} ta).")
+            topics.append(part)
+    return topics
+
+
+def _fit_topic(topic: str, row_no: int) -> list:
+    """Juda uzun katak bir nechta mavzuga bo‘linadi; bo‘linmasa — API ga yuborilmay rad etiladi."""
+    if estimate_tokens(topic) <= MAX_TOPIC_TOKENS:
+        return [topic]
+    parts = split_topic(topic)
+    if len(parts) > 1 and all(estimate_tokens(p) <= MAX_TOPIC_TOKENS for p in parts):
+        return parts
+    raise TopicFileError(f"❌ {row_no}-qatordagi mavzu juda uzun. Mavzuni qisqartiring yoki alohida qatorlarga bo‘ling.")
+
+
+def _read_xlsx(data: bytes) -> list:
+    from openpyxl import load_workbook
+    try:
+        wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception:
+        raise TopicFileError("❌ Excel faylni o‘qib bo‘lmadi. Faylni .xlsx formatda saqlang.")
+    try:
+        return _collect(wb.active.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def _read_csv(data: bytes) -> list:
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise TopicFileError("❌ CSV fayl kodirovkasini aniqlab bo‘lmadi (UTF-8 tavsiya etiladi).")
+    try:
+        dialect = csv.Sniffer().sniff(text[:2048], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return _collect(csv.reader(io.StringIO(text), dialect))
+
+
+def read_topics(data: bytes, filename: str) -> list:
+    if len(data) > TOPICS_MAX_BYTES:
+        raise TopicFileError(f"❌ Fayl juda katta (maksimum {TOPICS_MAX_BYTES // (1024 * 1024)} MB).")
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".csv":
+        return _read_csv(data)
+    if ext in (".xlsx", ".xlsm"):
+        return _read_xlsx(data)
+    raise TopicFileError("❌ Faqat .xlsx yoki .csv fayl yuboring.")
+
+
+async def read_topics_async(data: bytes, filename: str) -> list:
+    # openpyxl sinxron ishlaydi — event loop bloklanmasin
+    return await asyncio.to_thread(read_topics, data, filename)
@@ -0,0 +1,76 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import unicodedata
+
+from utils import metrics
+from utils.db import run_db, cache_get, cache_put, cache_evict, cache_invalidate, cache_count
+
+logger = logging.getLogger(__name__)
+
+# === Kesh sozlamalari ===
+GEN_CACHE_ENABLED = os.getenv("GEN_CACHE_ENABLED", "1") == "1"
+GEN_CACHE_TTL = int(os.getenv("GEN_CACHE_TTL", str(30 * 24 * 3600)))
+GEN_CACHE_MAX_ENTRIES = int(os.getenv("GEN_CACHE_MAX_ENTRIES", "5000"))
+GEN_CACHE_EVICT_EVERY = 20  # har N ta yozuvdan keyin eskilari tozalanadi
+
+stats = {"hits": 0, "misses": 0, "puts": 0}
+
+# === Kalitni normallashtirish ===
+_APOSTROPHES = re.compile(r"[‘’ʻʼ`´']")
+_SPACES = re.compile(r"\s+")
+
+def normalize(text) -> str:
+    """Katta-kichik harf, ortiqcha bo‘shliq va o‘/o'/oʻ farqlarini yo‘qotadi."""
+    text = unicodedata.normalize("NFC", str(text or ""))
+    text = _APOSTROPHES.sub("'", text).casefold()
+    return _SPACES.sub(" ", text).strip(" .,;:!?")
+
+def make_label(*parts) -> str:
+    return " / ".join(normalize(p) for p in parts)
+
+def make_key(task: str, model: str, temperature: float, *parts) -> str:
+    payload = json.dumps([task, model, round(float(temperature), 2), [normalize(p) for p in parts]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# === Asosiy API ===
+async def get(key: str):
+    if not GEN_CACHE_ENABLED:
+        return None
+    now = time.time()
+    text = await run_db(cache_get, key, now - GEN_CACHE_TTL, now)
+    stats["hits" if text is not None else "misses"] += 1
+    (metrics.CACHE_HIT if text is not None else metrics.CACHE_MISS).inc()
+    return text
+
+async def put(key: str, task: str, label: str, text: str):
+    if not GEN_CACHE_ENABLED or not text:
+        return
+    now = time.time()
+    await run_db(cache_put, key, task, label, text, now)
+    stats["puts"] += 1
+    if stats["puts"] % GEN_CACHE_EVICT_EVERY == 0:
+        removed = await run_db(cache_evict, now - GEN_CACHE_TTL, GEN_CACHE_MAX_ENTRIES)
+        if removed:
+            logger.info("Keshdan %s ta eski yozuv o‘chirildi.", removed)
+
+async def invalidate(label_part: str = None) -> int:
+    if label_part is None:
+        return await run_db(cache_invalidate, None)
+    label_part = normalize(label_part)
+    if not label_part:
+        return 0  # "/cache_clear ." butun keshni o‘chirmasin
+    return await run_db(cache_invalidate, label_part)
+
+async def summary() -> dict:
+    total = stats["hits"] + stats["misses"]
+    return {
+        "entries": await run_db(cache_count),
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_ratio": stats["hits"] / total if total else 0.0,
+    }
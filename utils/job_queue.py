@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from aiogram import Bot
+
+from utils.db import (
+    run_db, job_enqueue, job_claim, job_next_due, job_finish, job_retry,
+    job_requeue_running, job_cleanup, job_counts,
+)
+
+logger = logging.getLogger(__name__)
+
+# === Sozlamalar ===
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "15"))   # 15s, 30s, 60s ...
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "30"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+
+class Job(NamedTuple):
+    id: int
+    kind: str
+    user_id: int
+    chat_id: int
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+class JobRetry(Exception):
+    """Ish keyinroq qayta urinilsin (delay berilsa — shuncha soniyadan keyin)."""
+
+    def __init__(self, message: str, delay: Optional[float] = None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobFailed(Exception):
+    """Qayta urinishning ma’nosi yo‘q — ish darhol 'failed'."""
+
+
+Runner = Callable[[Bot, Job], Awaitable[None]]
+FailHandler = Callable[[Bot, Job, str], Awaitable[None]]
+
+
+# === SQLite'dagi navbat: enqueued → running → done / failed ===
+class JobQueue:
+    """
+    Handler faqat enqueue() qiladi; workerlar ishni bazadan oladi, bajaradi
+    va natijani foydalanuvchiga yuboradi. Jarayon qayta ishga tushsa,
+    'running' holatida qolgan ishlar start() da qayta navbatga qaytadi.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = max(1, workers)
+        self.bot: Optional[Bot] = None
+        self._runners: Dict[str, Runner] = {}
+        self._fail_handlers: Dict[str, FailHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self._running: Dict[int, asyncio.Task] = {}
+
+    def register(self, kind: str, run: Runner, on_fail: FailHandler = None):
+        self._runners[kind] = run
+        if on_fail:
+            self._fail_handlers[kind] = on_fail
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        now = time.time()
+        resumed = await run_db(job_requeue_running, now)
+        removed = await run_db(job_cleanup, now - JOB_RETENTION_DAYS * 86400)
+        if resumed:
+            logger.info("Chala qolgan %s ta ish qayta navbatga qo‘yildi.", resumed)
+        if removed:
+            logger.info("%s ta eski ish tozalandi.", removed)
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i), name=f"job-worker-{i}"))
+
+    async def enqueue(self, kind: str, idem_key: str, user_id: int, chat_id: int, payload: dict,
+                      max_attempts: int = JOB_MAX_ATTEMPTS):
+        """(job_id, yangi_mi) — takroriy idem_key yangi ish yaratmaydi."""
+        job_id, created = await run_db(
+            job_enqueue, idem_key, kind, user_id, chat_id,
+            json.dumps(payload, ensure_ascii=False), max_attempts, time.time()
+        )
+        if created:
+            self._wakeup.set()
+        return job_id, created
+
+    async def _next_job(self) -> Job:
+        while True:
+            row = await run_db(job_claim, time.time())
+            if row:
+                job_id, kind, user_id, chat_id, payload, attempts, max_attempts = row
+                return Job(job_id, kind, user_id, chat_id, json.loads(payload or "{}"), attempts, max_attempts)
+            due = await run_db(job_next_due)
+            timeout = JOB_POLL_INTERVAL if due is None else min(JOB_POLL_INTERVAL, max(0.0, due - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._next_job()
+            # bitta worker ishni olsa, boshqalari ham navbatni tekshirsin
+            self._wakeup.set()
+            task = asyncio.ensure_future(self._run(job))
+            self._running[job.id] = task
+            task.add_done_callback(lambda _, job_id=job.id: self._running.pop(job_id, None))
+            # worker to‘xtatilsa ham ish o‘zi davom etadi — stop() uni timeout gacha kutadi
+            await asyncio.shield(task)
+
+    async def _run(self, job: Job):
+        runner = self._runners.get(job.kind)
+        try:
+            if runner is None:
+                raise JobFailed(f"Noma’lum ish turi: {job.kind}")
+            await runner(self.bot, job)
+        except asyncio.CancelledError:
+            raise
+        except JobFailed as e:
+            await self._fail(job, str(e))
+        except Exception as e:
+            if job.attempts >= job.max_attempts:
+                return await self._fail(job, str(e))
+            delay = e.delay if isinstance(e, JobRetry) and e.delay else JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning("Ish #%s (%s) xato, %.0fs dan so‘ng qayta: %s", job.id, job.kind, delay, e)
+            now = time.time()
+            await run_db(job_retry, job.id, str(e), now + delay, now)
+        else:
+            await run_db(job_finish, job.id, "done", None, time.time())
+
+    async def _fail(self, job: Job, error: str):
+        logger.error("Ish #%s (%s) bajarilmadi: %s", job.id, job.kind, error)
+        await run_db(job_finish, job.id, "failed", error, time.time())
+        on_fail = self._fail_handlers.get(job.kind)
+        if on_fail:
+            try:
+                await on_fail(self.bot, job, error)
+            except Exception as e:
+                logger.warning("Ish #%s xatosi foydalanuvchiga yetkazilmadi: %s", job.id, e)
+
+    async def stop(self, timeout: float = 30.0):
+        """Yangi ish olinmaydi; bajarilayotganlari timeout gacha kutiladi, qolgani keyingi startga qoladi."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        running = list(self._running.values())
+        if running:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                task.cancel()  # bazada 'running' qoladi va keyingi startda davom etadi
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning("%s ta ish tugamadi — keyingi ishga tushishda davom etadi.", len(pending))
+
+    def in_progress(self) -> int:
+        return len(self._running)
+
+
+async def counts() -> dict:
+    return await run_db(job_counts)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,193 @@
+import os
+import logging
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from utils.db import run_db, refund_free_use
+from utils.job_queue import JobQueue, Job, JobRetry
+from utils.openai_api import (
+    generate_conspect, generate_lesson_plan, generate_methodical_advice, analyze_teaching_problem,
+    is_error_text, format_partial,
+)
+from utils.circuit_breaker import BREAKER_MESSAGE, BREAKER_OPEN_SECONDS
+from utils.rate_limiter import request_priority, PRIORITY_PREMIUM, PRIORITY_INTERACTIVE
+from utils.docx_generator import render_bulk_docx_async, get_preview
+from utils.delivery import send_generated_docx
+from utils.live_message import LiveMessage, TELEGRAM_TEXT_LIMIT
+from utils.bulk import generate_bulk, forget_batch
+
+logger = logging.getLogger(__name__)
+
+# konspekt matni OpenAI oqimidan kelishi bilan ko‘rsatiladi
+STREAM_MODE = os.getenv("STREAM_MODE", "1") == "1"
+LOCK_NOTE = "\n\n🔒 To‘liq konspekt (DOCX) faqat Premium foydalanuvchilar uchun."
+LESSON_LOCK_NOTE = "\n\n🔒 To‘liq dars ishlanma (DOCX) faqat Premium foydalanuvchilar uchun."
+
+
+# === Handler yuborgan "qabul qilindi" xabarini worker ichidan tahrirlash ===
+class StatusMessage:
+    """LiveMessage/_Progress uchun Message o‘rnini bosadi: faqat edit_text kerak."""
+
+    def __init__(self, bot: Bot, chat_id: int, message_id: int = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text: str):
+        if self.message_id is None:
+            sent = await self.bot.send_message(self.chat_id, text)
+            self.message_id = sent.message_id
+            return
+        await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+
+    async def show(self, text: str):
+        """Yakuniy xabar: tahrirlab bo‘lmasa (xabar o‘chirilgan), yangisi yuboriladi."""
+        try:
+            await self.edit_text(text)
+        except Exception as e:
+            logger.debug("Status xabarini tahrirlab bo‘lmadi: %s", e)
+            await self.bot.send_message(self.chat_id, text)
+
+
+def _retry_on_error(text: str):
+    if is_error_text(text):
+        # xizmat yiqilgan bo‘lsa, breaker ochiq turgan vaqtcha kutamiz
+        raise JobRetry(text, delay=BREAKER_OPEN_SECONDS if text == BREAKER_MESSAGE else None)
+
+
+# === Konspekt: generatsiya → preview yoki DOCX ===
+async def run_conspect(bot: Bot, job: Job):
+    p = job.payload
+    status = StatusMessage(bot, job.chat_id, p.get("status_message_id"))
+    is_full = p.get("full", False)
+    request_priority.set(PRIORITY_PREMIUM if is_full else PRIORITY_INTERACTIVE)
+
+    live = None
+    if STREAM_MODE:
+        # matn kelishi bilan bitta xabar yangilanadi; bepul foydalanuvchiga yakuniy
+        # get_preview bilan bir xil chegara (hozircha kelgan qatorlarning 20%) — oxirgisidan ko‘p emas
+        live = LiveMessage(status, formatter=format_partial, preview=None if is_full else get_preview)
+    result = await generate_conspect(p["subject"], p["grade"], p["topic"], on_text=live.push if live else None)
+    _retry_on_error(result)
+
+    if not is_full:
+        preview = get_preview(result)
+        if live:
+            return await live.finish(preview, LOCK_NOTE)
+        return await status.show(preview[:3500] + LOCK_NOTE)
+
+    if live:
+        await live.finish(result)
+    await send_generated_docx(
+        bot, job.chat_id, job.user_id, result, p["subject"], p["grade"], p["topic"],
+        caption="✅ Konspekt tayyor!"
+    )
+
+
+async def _report_failure(bot: Bot, job: Job, text: str):
+    if job.payload.get("free_use") and await run_db(refund_free_use, job.user_id):
+        text += "\n🎁 Bepul imkoniyatingiz qaytarildi."
+    await StatusMessage(bot, job.chat_id, job.payload.get("status_message_id")).show(text)
+
+
+async def conspect_failed(bot: Bot, job: Job, error: str):
+    text = error if is_error_text(error) else f"❌ Konspekt yaratishda xatolik yuz berdi: {error}"
+    await _report_failure(bot, job, text)
+
+
+# === Dars ishlanma: reja → bo‘limlar parallel (LESSON_PARALLEL), oqimsiz ===
+async def run_lesson(bot: Bot, job: Job):
+    p = job.payload
+    status = StatusMessage(bot, job.chat_id, p.get("status_message_id"))
+    is_full = p.get("full", False)
+    request_priority.set(PRIORITY_PREMIUM if is_full else PRIORITY_INTERACTIVE)
+
+    result = await generate_lesson_plan(p["subject"], p["grade"], p["topic"])
+    _retry_on_error(result)
+
+    if not is_full:
+        return await status.show(get_preview(result)[:3500] + LESSON_LOCK_NOTE)
+    await send_generated_docx(
+        bot, job.chat_id, job.user_id, result, p["subject"], p["grade"], p["topic"],
+        mode="dars_ishlanma", caption="✅ Dars ishlanma tayyor!"
+    )
+
+
+async def lesson_failed(bot: Bot, job: Job, error: str):
+    text = error if is_error_text(error) else f"❌ Dars ishlanma yaratishda xatolik: {error}"
+    await _report_failure(bot, job, text)
+
+
+# === Metodik maslahat / muammo tahlili: javob matn sifatida ===
+def _chunks(text: str, limit: int = TELEGRAM_TEXT_LIMIT):
+    """Telegram chegarasidan uzun matn qator chegarasida bo‘linadi."""
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        cut = cut if cut > limit // 2 else limit
+        yield text[:cut].rstrip()
+        text = text[cut:].lstrip("\n")
+    if text:
+        yield text
+
+
+async def _send_text(bot: Bot, job: Job, text: str):
+    status = StatusMessage(bot, job.chat_id, job.payload.get("status_message_id"))
+    parts = list(_chunks(text))
+    await status.show(parts[0])
+    for part in parts[1:]:
+        await bot.send_message(job.chat_id, part)
+
+
+async def run_advice(bot: Bot, job: Job):
+    p = job.payload
+    request_priority.set(PRIORITY_PREMIUM if p.get("full") else PRIORITY_INTERACTIVE)
+    result = await generate_methodical_advice(p["subject"], p["grade"], p["topic"])
+    _retry_on_error(result)
+    await _send_text(bot, job, result)
+
+
+async def run_problem(bot: Bot, job: Job):
+    p = job.payload
+    request_priority.set(PRIORITY_PREMIUM if p.get("full") else PRIORITY_INTERACTIVE)
+    result = await analyze_teaching_problem(p["problem"])
+    _retry_on_error(result)
+    await _send_text(bot, job, result)
+
+
+async def text_failed(bot: Bot, job: Job, error: str):
+    text = error if is_error_text(error) else f"❌ Javob olishda xatolik yuz berdi: {error}"
+    await _report_failure(bot, job, text)
+
+
+# === Excel: ko‘p mavzu → yig‘ma DOCX ===
+async def run_bulk(bot: Bot, job: Job):
+    topics = job.payload["topics"]
+    status = StatusMessage(bot, job.chat_id, job.payload.get("status_message_id"))
+
+    # tayyor mavzular bulk_items da saqlanadi — qayta urinish faqat qolganlarini yaratadi
+    batch_id, sections, failed = await generate_bulk(job.user_id, topics, status)
+    if failed == len(topics):
+        raise JobRetry("❌ Konspektlarni yaratib bo‘lmadi.")
+    if failed and job.attempts < job.max_attempts:
+        raise JobRetry(f"{failed} ta mavzu yaratilmadi")
+
+    docx = await render_bulk_docx_async(sections, job.user_id)
+    caption = "✅ Yig‘ma konspekt tayyor!"
+    if failed:
+        caption += f"\n⚠️ {failed} ta mavzu yaratilmadi — faylni qayta yuborsangiz, faqat ular qayta ishlanadi."
+    await bot.send_document(job.chat_id, BufferedInputFile(docx.data, docx.filename), caption=caption)
+    if not failed:
+        await forget_batch(batch_id)
+
+
+async def bulk_failed(bot: Bot, job: Job, error: str):
+    await bot.send_message(job.chat_id, "❌ Konspektlarni yaratib bo‘lmadi. Birozdan so‘ng faylni qayta yuboring.")
+
+
+def register_jobs(queue: JobQueue):
+    queue.register("conspect", run_conspect, conspect_failed)
+    queue.register("lesson", run_lesson, lesson_failed)
+    queue.register("advice", run_advice, text_failed)
+    queue.register("problem", run_problem, text_failed)
+    queue.register("bulk", run_bulk, bulk_failed)
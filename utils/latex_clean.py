@@ -0,0 +1,187 @@
+import os
+import re
+from pathlib import Path
+
+# === LaTeX → oddiy matn: oldindan kompilyatsiya qilingan naqshlar va belgilar jadvali ===
+_SUP_MAP = str.maketrans("0123456789-+", "⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺")
+_SUB_MAP = str.maketrans("0123456789-+", "₀₁₂₃₄₅₆₇₈₉₋₊")
+
+# \buyruq → belgi; jadvalda yo‘q buyruqlar (va ulardan keyingi bo‘shliq) olib tashlanadi
+SYMBOLS = {
+    "leq": "≤", "le": "≤", "geq": "≥", "ge": "≥", "neq": "≠", "ne": "≠",
+    "times": "×", "cdot": "·", "div": "÷", "pm": "±", "approx": "≈",
+    "to": "→", "rightarrow": "→", "Rightarrow": "⇒", "infty": "∞", "degree": "°", "circ": "°",
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "Delta": "Δ", "pi": "π",
+    "left": "", "right": "",
+}
+
+# matematik qismlar: hamma muqobillar "$", "\\", "^" yoki "_" bilan boshlanadi — regex
+# matnni shu belgilar bo‘yicha tez skanerlaydi, formulalar bitta o‘tishda tozalanadi.
+# \frac/\sqrt argumentida bir daraja ichki {..} bo‘lishi mumkin (\frac{-b \pm \sqrt{D}}{2a}) —
+# u argument qayta tozalanganda ochiladi; chuqurroq ichma-ichlik keyingi o‘tishlarda.
+_BRACED = r"[^{}]*(?:\{[^{}]*\}[^{}]*)*"
+_MATH = re.compile(
+    r"\$\$(?P<dd>.*?)\$\$|\$(?P<d>.*?)\$|\\\((?P<p>.*?)\\\)|\\\[(?P<b>.*?)\\\]"
+    r"|\\frac\s*\{(?P<num>%s)\}\s*\{(?P<den>%s)\}"
+    r"|\\sqrt\s*\{(?P<root>%s)\}"
+    r"|\\(?:text|mathrm|mathbf)\s*\{(?P<txt>[^{}]*)\}"
+    r"|\\(?P<space>[ ,;:!])"
+    r"|\\(?!(?:frac|sqrt)\b)(?P<cmd>[A-Za-z]+)(?P<cmd_ws>\s*)"
+    r"|\^(?:\s*(?P<deg>\\circ|\{\\circ\})|\{(?P<sup>[^}]+)\}|(?P<sup1>[0-9]))"
+    r"|_(?:\{(?P<sub>[^}]+)\}|(?P<sub1>[0-9]))"
+    % ((_BRACED,) * 3)
+)
+_SUP_BASE = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789)}")
+_MAX_NESTING = 4
+_SCRIPTABLE = re.compile(r"[0-9+\-, ]+")
+_LEFTOVER = re.compile(r"\\(?:frac|sqrt)\b\s*")
+# kasr surati/maxraji murakkab bo‘lsa qavsga olinadi: (5+1)/2
+_COMPOUND = re.compile(r"[\s+\-±×·/=]")
+
+# amallar atrofida bitta bo‘shliq; "**" (markdown qalin matn) tegilmaydi
+_OPERATOR = re.compile(r"\*\*+|[=+\-/×·≥≤≠±<>*]")
+# qavs ichidagi chetki bo‘shliqlar va qavsdan keyingi unar minus: "( - b )" → "(-b)"
+_PAREN = re.compile(r"\( *(-) +|\( +| +\)")
+
+
+def _math(m: "re.Match") -> str:
+    kind = m.lastgroup
+    if kind in ("dd", "d", "p", "b"):
+        return clean_fragment(m.group(kind)).strip()
+    if kind == "den":
+        return f"{_group(clean_fragment(m.group('num')))}/{_group(clean_fragment(m.group('den')))}"
+    if kind == "root":
+        return f"√({clean_fragment(m.group('root'))})"
+    if kind == "txt":
+        return m.group("txt")
+    if kind == "space":
+        return " "  # \  \, \; — LaTeX bo‘shliqlari
+    if kind == "deg":
+        return "°"
+    if kind == "cmd_ws":
+        symbol = SYMBOLS.get(m.group("cmd"))
+        # jadvalda yo‘q buyruq keyingi bo‘shliq bilan birga olib tashlanadi
+        return "" if symbol is None else symbol + m.group("cmd_ws")
+    if kind in ("sup", "sub"):
+        return _script(m.group(kind), kind)
+    # x^2, x_1 — faqat harf/raqam/qavsdan keyin
+    start = m.start()
+    if start and m.string[start - 1] in _SUP_BASE:
+        return m.group(kind).translate(_SUP_MAP if kind == "sup1" else _SUB_MAP)
+    return m.group(0)
+
+
+def _script(part: str, kind: str) -> str:
+    """Raqamlar ustki/pastki belgiga; harfli ifoda belgisi bilan qoladi: x^{n+1} → x^(n+1)."""
+    if _SCRIPTABLE.fullmatch(part):
+        return part.translate(_SUP_MAP if kind == "sup" else _SUB_MAP)
+    mark = "^" if kind == "sup" else "_"
+    return f"{mark}{part}" if len(part) == 1 else f"{mark}({part})"
+
+
+def _group(part: str) -> str:
+    part = part.strip()
+    return f"({part})" if _COMPOUND.search(part) else part
+
+
+def _operator(m: "re.Match") -> str:
+    op = m.group()
+    return op if len(op) > 1 else f" {op} "
+
+
+def _paren(m: "re.Match") -> str:
+    if m.group()[0] != "(":
+        return ")"
+    return "(-" if m.group(1) else "("
+
+
+def _layout(text: str) -> str:
+    """Qatorlar saqlanadi: har qatorda ortiqcha bo‘shliq qisqaradi, ketma-ket bo‘sh qatorlar bittaga tushadi."""
+    lines, blank = [], False
+    for line in text.split("\n"):
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+            blank = False
+        elif lines and not blank:
+            lines.append("")
+            blank = True
+    return "\n".join(lines).strip()
+
+
+def clean_fragment(text: str) -> str:
+    text = _MATH.sub(_math, text)
+    if "\\" not in text:
+        return text
+    # ichma-ich \frac{..\sqrt{..}..}: faqat ochilmagan buyruq qolgan bo‘lsa qayta o‘tiladi
+    for _ in range(_MAX_NESTING):
+        if not _LEFTOVER.search(text):
+            return text
+        cleaned = _MATH.sub(_math, text)
+        if cleaned == text:
+            break
+        text = cleaned
+    return _LEFTOVER.sub("", text)  # ochib bo‘lmagan (buzuq) \frac/\sqrt — eski xatti-harakat: olib tashlanadi
+
+
+def clean_latex(text: str) -> str:
+    """
+    Javobdagi LaTeX ni o‘qituvchi tushunadigan oddiy belgilarga aylantiradi:
+    $..$ / \\(..\\) ichidagi formulalar, \\frac, \\sqrt, daraja (x^2 → x²), \\leq kabi belgilar.
+    Qatorlar saqlanadi (DOCX sarlavhalari qator bo‘yicha aniqlanadi), ortiqcha bo‘shliqlar qisqaradi.
+    """
+    if not text:
+        return text
+    if "$" in text or "\\" in text or "^" in text or "_" in text:
+        text = clean_fragment(text)
+    return _layout(_PAREN.sub(_paren, _OPERATOR.sub(_operator, text)))
+
+
+# === Golden korpus: haqiqiy javoblarni yig‘ish va kutilgan natijani yozish ===
+# LATEX_CORPUS_DIR berilsa, modelning xom javoblari (tozalashdan oldin) shu papkaga
+# <vazifa>_<kalit>.in.txt sifatida yoziladi; keyin tests/fixtures/latex ga ko‘chiriladi.
+LATEX_CORPUS_DIR = os.getenv("LATEX_CORPUS_DIR", "").strip()
+
+
+def capture_sample(name: str, raw: str):
+    path = Path(LATEX_CORPUS_DIR) / f"{name}.in.txt"
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(raw, encoding="utf-8")
+
+
+def write_golden(directory: str) -> int:
+    """Har bir .in.txt uchun .out.txt ni joriy clean_latex bilan yozadi; natijani ko‘z bilan tekshiring."""
+    count = 0
+    for source in sorted(Path(directory).glob("*.in.txt")):
+        expected = source.with_name(source.name[: -len(".in.txt")] + ".out.txt")
+        expected.write_text(clean_latex(source.read_text(encoding="utf-8")) + "\n", encoding="utf-8")
+        count += 1
+    return count
+
+
+# === Mikro-benchmark: python -m utils.latex_clean [--golden papka] ===
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if sys.argv[1:2] == ["--golden"]:
+        print(f"{write_golden(sys.argv[2])} ta .out.txt yozildi")
+        raise SystemExit(0)
+
+    sample = (
+        "5. Yangi mavzu bayoni:\n"
+        "Kvadrat tenglama $ax^2 + bx + c = 0$ ko‘rinishida yoziladi, bu yerda \\(a \\neq 0\\).\n"
+        "Diskriminant: $$D = b^{2} - 4ac$$, ildizlar: $x = \\frac{-b \\pm \\sqrt{D}}{2a}$.\n"
+        "- Agar D \\geq 0 bo‘lsa, tenglama haqiqiy ildizlarga ega.\n"
+        "**Misol:** 2x^2 - 3x + 1 = 0, D = 9 - 8 = 1, x₁ = 1, x₂ = 1/2.\n\n"
+    )
+    for kb in (10, 25, 50):
+        doc = sample * (kb * 1024 // len(sample) + 1)
+        runs = 50
+        started = time.perf_counter()
+        for _ in range(runs):
+            clean_latex(doc)
+        elapsed = time.perf_counter() - started
+        print(f"{kb:>3} KB: {elapsed / runs * 1000:7.2f} ms/hujjat, {kb * runs / 1024 / elapsed:6.1f} MB/s")
@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram bitta chatda ~1 tahrir/soniyadan tezini yoqtirmaydi
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+TELEGRAM_TEXT_LIMIT = 3800
+CURSOR = " ▌"
+
+
+# === Bitta xabarni oqim davomida cheklangan tezlikda yangilash ===
+class LiveMessage:
+    """
+    push() har safar jami matn bilan chaqiriladi; xabar birinchi bo‘lakda darhol,
+    keyin esa STREAM_EDIT_INTERVAL dan tez bo‘lmagan holda tahrirlanadi (formatlash ham faqat shunda).
+    preview — oqim davomida ko‘rsatiladigan qism (bepul foydalanuvchi uchun get_preview).
+    Tahrir xatolari tashqariga chiqmaydi: oqim umumiy (SingleFlight) generatsiya ichida ishlaydi,
+    bitta foydalanuvchining xabari uchun uni to‘xtatib bo‘lmaydi.
+    """
+
+    def __init__(self, message, limit: int = TELEGRAM_TEXT_LIMIT, formatter=None, preview=None):
+        self.message = message
+        self.limit = min(limit, TELEGRAM_TEXT_LIMIT)
+        self.formatter = formatter
+        self.preview = preview
+        self._next_edit = 0.0
+        self._shown = None
+        self.truncated = False
+        self.stopped = False  # Telegram xatosidan keyin oraliq tahrirlar yuborilmaydi
+
+    def _render(self, text: str, partial: bool = False) -> str:
+        if self.formatter:
+            text = self.formatter(text)
+        if partial and self.preview:
+            text = self.preview(text)
+        if len(text) > self.limit:
+            self.truncated = True
+            cut = text.rfind("\n", 0, self.limit)
+            text = text[:cut if cut > self.limit // 2 else self.limit].rstrip() + " …"
+        return text
+
+    async def _edit(self, text: str):
+        if not text or text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text)
+            self._shown = text
+        except TelegramRetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+        except TelegramBadRequest as e:
+            logger.debug("Xabarni tahrirlab bo‘lmadi: %s", e)
+        except TelegramAPIError as e:
+            # bot bloklangan, tarmoq xatosi va h.k. — jonli ko‘rinish ixtiyoriy
+            self.stopped = True
+            logger.warning("Jonli xabar yangilanishi to‘xtatildi: %s", e)
+
+    async def push(self, text: str):
+        # limit ga yetilgan bo‘lsa, qolgan oqim ko‘rsatilmaydi
+        if self.truncated or self.stopped or time.monotonic() < self._next_edit:
+            return
+        self._next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+        rendered = self._render(text, partial=True)
+        await self._edit(rendered if self.truncated else rendered + CURSOR)
+
+    async def finish(self, text: str, suffix: str = ""):
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(min(delay, STREAM_EDIT_INTERVAL))
+        self.truncated = False
+        await self._edit(self._render(text) + suffix)
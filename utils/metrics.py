@@ -0,0 +1,211 @@
+import os
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# === Sozlamalar ===
+# bitta metrikada shundan ko‘p label kombinatsiyasi bo‘lsa, qolganlari "other" ga tushadi
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "100"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# soniyalar: tez amallar (SQLite, handler) dan uzoq OpenAI javoblarigacha
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# OpenAI chaqiruvi qaysi vazifa uchunligi (_generate o‘rnatadi)
+openai_task: ContextVar[str] = ContextVar("openai_task", default="other")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# === Metrika turlari ===
+# Qiymatlar oddiy list/float da — lock yo‘q: yozuvlar event loop dan (yoki bitta sqlite oqimidan) keladi.
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[tuple, object] = {}
+        _registry.append(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """Bitta label kombinatsiyasi uchun qiymat obyekti."""
+
+    def labels(self, *values):
+        """Bola seriya keshdan olinadi; tez-tez chaqiriladigan joylar uni oldindan saqlab qo‘yadi."""
+        child = self._children.get(values)
+        if child is None:
+            if len(self._children) >= METRICS_MAX_SERIES:
+                values = ("other",) * len(self.label_names)
+                child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+        return child
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self._children.items()):
+            self._render_child(out, values, child)
+
+    def _render_child(self, out: List[str], values: tuple, child):
+        out.append(f"{self.name}{self._label_str(values)} {_fmt(child.value)}")
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Qiymat set() bilan yoki scrape paytida funksiyadan (set_function) olinadi."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def render(self, out: List[str]):
+        if self._function is not None:
+            self.set(self._function())
+        super().render(out)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # oxirgisi — +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=FAST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, out: List[str], values: tuple, child: _HistogramChild):
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), list(child.counts)):
+            total += count
+            le = 'le="%s"' % _fmt(bound)
+            out.append(f"{self.name}_bucket{self._label_str(values, le)} {total}")
+        out.append(f"{self.name}_sum{self._label_str(values)} {_fmt(child.sum)}")
+        out.append(f"{self.name}_count{self._label_str(values)} {total}")
+
+
+_registry: List[_Metric] = []
+
+
+def render() -> str:
+    out: List[str] = []
+    for metric in _registry:
+        metric.render(out)
+    return "\n".join(out) + "\n"
+
+
+# === Bot metrikalari ===
+webhook_seconds = Histogram("bot_webhook_seconds", "Webhook so‘rovini qabul qilish vaqti")
+handler_seconds = Histogram("bot_handler_seconds", "Handler bajarilish vaqti", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Xato bilan tugagan handlerlar", ("handler",))
+
+openai_seconds = Histogram("openai_request_seconds", "OpenAI so‘rovi davomiyligi",
+                           ("model", "task"), buckets=SLOW_BUCKETS)
+openai_errors = Counter("openai_errors_total", "Xato bilan tugagan OpenAI so‘rovlari", ("model", "task"))
+openai_tokens = Counter("openai_tokens_total", "Sarflangan tokenlar", ("model", "task", "kind"))
+
+docx_seconds = Histogram("docx_render_seconds", "DOCX render vaqti", ("kind",))
+sqlite_seconds = Histogram("sqlite_call_seconds", "run_db chaqiruvi (navbat + bajarilish)", ("op",))
+
+queue_depth = Gauge("bot_queue_depth", "Navbatlar uzunligi", ("queue",))
+jobs_gauge = Gauge("bot_jobs", "Ishlar holat bo‘yicha", ("status",))
+
+cache_hits = Counter("gen_cache_hits_total", "Generatsiya keshidan topilganlar")
+cache_misses = Counter("gen_cache_misses_total", "Generatsiya keshida yo‘qlar")
+cache_hit_ratio = Gauge("gen_cache_hit_ratio", "Kesh hit ulushi (jarayon boshidan)")
+
+# label qiymatlari kodda qat’iy — hot path uchun oldindan yaratiladi
+WEBHOOK = webhook_seconds.labels()
+CACHE_HIT = cache_hits.labels()
+CACHE_MISS = cache_misses.labels()
+DOCX_SINGLE = docx_seconds.labels("single")
+DOCX_BULK = docx_seconds.labels("bulk")
+
+
+def _hit_ratio() -> float:
+    total = CACHE_HIT.value + CACHE_MISS.value
+    return CACHE_HIT.value / total if total else 0.0
+
+
+cache_hit_ratio.set_function(_hit_ratio)
+
+
+def record_openai(model: str, seconds: float, usage=None, ok: bool = True):
+    task = openai_task.get()
+    if not ok:
+        openai_errors.labels(model, task).inc()
+        return
+    openai_seconds.labels(model, task).observe(seconds)
+    if usage is not None:
+        openai_tokens.labels(model, task, "prompt").inc(usage.prompt_tokens or 0)
+        openai_tokens.labels(model, task, "completion").inc(usage.completion_tokens or 0)
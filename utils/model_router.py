@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.rate_limiter import slot_acquired
+
+logger = logging.getLogger(__name__)
+
+# === Sozlamalar ===
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gpt-4o-mini")
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "gpt-3.5-turbo")
+HEDGE_AFTER = float(os.getenv("HEDGE_AFTER", "12"))  # 0 — hedge o‘chiq
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+
+# vazifa bo‘yicha siyosat, masalan:
+# '{"conspect": {"models": ["gpt-4o-mini", "gpt-3.5-turbo"], "hedge_after": "p95", "by_latency": false}}'
+# hedge_after: soniya, "p95" (birinchi modelning p95 kechikishi) yoki 0 (o‘chiq);
+# by_latency: sog‘lom modellarni p50 bo‘yicha tartiblash (aks holda ro‘yxat tartibi)
+_DEFAULT_POLICY = {"models": [DEFAULT_MODEL, FALLBACK_MODEL], "hedge_after": HEDGE_AFTER, "by_latency": False}
+ROUTE_POLICY: Dict[str, dict] = {
+    "conspect": dict(_DEFAULT_POLICY),
+    "lesson": dict(_DEFAULT_POLICY),
+    "advice": dict(_DEFAULT_POLICY),
+    "problem": dict(_DEFAULT_POLICY),
+}
+for _task, _policy in json.loads(os.getenv("ROUTE_POLICY", "{}") or "{}").items():
+    ROUTE_POLICY[_task] = {**_DEFAULT_POLICY, **_policy}
+
+
+# === Model bo‘yicha sirpanuvchi oyna statistikasi ===
+class ModelStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=ROUTER_WINDOW)
+
+    def record(self, ok: bool, latency: float):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def record_abandoned(self, elapsed: float):
+        # hedge yutqazgan so‘rov: haqiqiy kechikish kamida shuncha edi
+        self.latencies.append(elapsed)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        data = sorted(self.latencies)
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+_stats: Dict[str, ModelStats] = {}
+hedges = {"started": 0, "won": 0}
+
+# javob bergan modellar — _generate ro‘yxat qo‘yadi, hedged (va bola task'lar) unga yozadi
+answered_by: ContextVar[Optional[list]] = ContextVar("answered_by", default=None)
+
+def stats_for(model: str) -> ModelStats:
+    return _stats.setdefault(model, ModelStats())
+
+
+def plan(task: str):
+    """Vazifa uchun modellar tartibi va hedge kechikishi. Nosoz model oxiriga suriladi."""
+    policy = ROUTE_POLICY.get(task, _DEFAULT_POLICY)
+    models = list(dict.fromkeys(policy["models"]))  # takrorlarsiz, tartib saqlanadi
+    healthy = [m for m in models if stats_for(m).error_rate() < ROUTER_MAX_ERROR_RATE]
+    unhealthy = [m for m in models if m not in healthy]
+    if policy.get("by_latency"):
+        healthy.sort(key=lambda m: stats_for(m).percentile(0.5) or 0.0)
+    ordered = healthy + unhealthy
+
+    hedge_after = policy.get("hedge_after") or None
+    if hedge_after == "p95":
+        hedge_after = stats_for(ordered[0]).percentile(0.95) or HEDGE_AFTER or None
+    return ordered, hedge_after
+
+
+async def _timed(model: str, call: Callable[[str], Awaitable], on_slot: Callable[[], None] = None):
+    """Kechikish birinchi slot olingandan hisoblanadi — limiter navbatidagi kutish modelga yozilmaydi."""
+    started = time.monotonic()
+    acquired = False
+
+    def _acquired():
+        nonlocal started, acquired
+        if acquired:
+            return  # davom ettirish / qayta urinishlar — faqat birinchi slot
+        acquired = True
+        started = time.monotonic()
+        if on_slot is not None:
+            on_slot()
+
+    slot_acquired.set(_acquired)  # shu task konteksti ichida
+    try:
+        result = await call(model)
+    except asyncio.CancelledError:
+        if acquired:
+            stats_for(model).record_abandoned(time.monotonic() - started)
+        raise
+    except Exception:
+        stats_for(model).record(False, time.monotonic() - started)
+        raise
+    stats_for(model).record(True, time.monotonic() - started)
+    return result
+
+
+# === Hedged so‘rov: birinchi model kechiksa, ikkinchisi ham yuboriladi ===
+async def hedged(task: str, call: Callable[[str], Awaitable]):
+    """
+    call(model) — bitta model bilan so‘rov. Birinchi model slot olgandan keyin
+    hedge_after soniyada javob bermasa yoki xato bersa, keyingi model ishga tushadi;
+    qaysi biri avval muvaffaqiyatli tugasa, o‘sha olinadi, qolgani bekor qilinadi.
+    Limiter navbatida turgan so‘rov hedge qilinmaydi (backpressure paytida tokenlar ikki barobar bo‘lmasin).
+    Javob bergan model answered_by ro‘yxatiga yoziladi (kesh kaliti uchun).
+    """
+    models, hedge_after = plan(task)
+    pending: List[asyncio.Task] = []
+    task_models: Dict[asyncio.Task, str] = {}
+    last_error: Optional[Exception] = None
+    hedge_task = None
+    loop = asyncio.get_running_loop()
+    primary_slot = asyncio.Event()
+    slot_waiter = asyncio.ensure_future(primary_slot.wait())
+    hedge_at = None
+
+    def _launch(model: str, on_slot=None):
+        task_ = asyncio.ensure_future(_timed(model, call, on_slot))
+        task_models[task_] = model
+        pending.append(task_)
+        return task_
+
+    def _primary_acquired():
+        nonlocal hedge_at
+        hedge_at = loop.time() + hedge_after if hedge_after else None
+        primary_slot.set()
+
+    remaining = list(models)
+    _launch(remaining.pop(0), _primary_acquired)
+    try:
+        while pending:
+            waiters = list(pending)
+            timeout = None
+            if remaining and hedge_task is None and hedge_after:
+                if hedge_at is not None:
+                    timeout = max(0.0, hedge_at - loop.time())
+                elif not slot_waiter.done():
+                    waiters.append(slot_waiter)  # slot olinishi bilan soat boshlanadi
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            done.discard(slot_waiter)
+            if not done:
+                if timeout is None:
+                    continue  # birinchi model slot oldi — endi hedge_after kutiladi
+                # kechikish — muqobil modelga parallel so‘rov
+                hedges["started"] += 1
+                hedge_task = _launch(remaining.pop(0))
+                logger.info("Hedge: %s kechikdi, %s ham yuborildi (%s)", models[0], task_models[hedge_task], task)
+                continue
+            for finished in done:
+                pending.remove(finished)
+                if finished.exception() is None:
+                    if finished is hedge_task:
+                        hedges["won"] += 1
+                    sink = answered_by.get()
+                    if sink is not None:
+                        sink.append(task_models[finished])
+                    return finished.result()
+                last_error = finished.exception()
+                logger.warning("%s modeli xato berdi: %s", task_models[finished], last_error)
+            if not pending and remaining:
+                _launch(remaining.pop(0))
+        raise last_error or RuntimeError("OpenAI javobi olinmadi.")
+    finally:
+        slot_waiter.cancel()
+        for t in pending:
+            t.cancel()
+
+
+def snapshot() -> dict:
+    out = {}
+    for model, st in _stats.items():
+        out[model] = {
+            "p50": st.percentile(0.5),
+            "p95": st.percentile(0.95),
+            "error_rate": st.error_rate(),
+            "calls": len(st.outcomes),
+        }
+    return out
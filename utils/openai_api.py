@@ -1,9 +1,23 @@
 import os
-import re
+import json
 import time
+import asyncio
 import logging
 from typing import Optional
-from openai import OpenAI
+
+import httpx
+from openai import AsyncOpenAI, APIStatusError, APIConnectionError
+
+from utils import gen_cache, metrics
+from utils.singleflight import SingleFlight
+from utils.rate_limiter import openai_slot
+from utils.circuit_breaker import openai_breaker, CircuitOpenError
+from utils import model_router
+from utils.latex_clean import clean_latex as _clean_latex, capture_sample, LATEX_CORPUS_DIR
+from utils.tokens import (
+    estimate_messages, budget_max_tokens, check_input, PromptTooLargeError,
+    MAX_TOPIC_TOKENS, MAX_INPUT_TOKENS,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -13,74 +27,285 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gpt-4o-mini")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.4"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "1500"))
+# vazifa bo‘yicha javob uzunligi: '{"problem": 900, "advice": 1200}' (qolganlari MAX_TOKENS)
+TASK_MAX_TOKENS = json.loads(os.getenv("TASK_MAX_TOKENS", "{}") or "{}")
+
+# === Dars ishlanmani bo‘limlab parallel yozish ===
+LESSON_PARALLEL = os.getenv("LESSON_PARALLEL", "1") == "1"
+LESSON_OUTLINE_TOKENS = int(os.getenv("LESSON_OUTLINE_TOKENS", "400"))
+LESSON_SECTION_TOKENS = int(os.getenv("LESSON_SECTION_TOKENS", str(MAX_TOKENS)))
+
+# === HTTP ulanishlar puli ===
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "90"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
 
-# === OpenAI klienti ===
-def _get_client() -> Optional[OpenAI]:
+# === Kesilgan javobni davom ettirish (finish_reason == "length") ===
+CONTINUE_MAX_ROUNDS = int(os.getenv("CONTINUE_MAX_ROUNDS", "3"))
+CONTINUE_TOKEN_BUDGET = int(os.getenv("CONTINUE_TOKEN_BUDGET", "4000"))  # bitta so‘rovga qo‘shimcha completion tokenlar
+CONTINUE_PROMPT = (
+    "Javob uzilib qoldi. Matnni aynan to‘xtagan joyidan davom ettiring: "
+    "oldingi qismni takrorlamang, kirish so‘zlarisiz yozing."
+)
+continuation_stats = {"requests": 0, "rounds": 0, "tokens": 0, "seconds": 0.0, "exhausted": 0}
+
+_client: Optional[AsyncOpenAI] = None
+
+# === OpenAI klienti (bitta, uzoq yashovchi) ===
+def _get_client() -> Optional[AsyncOpenAI]:
+    global _client
+    if _client is not None:
+        return _client
     if not OPENAI_API_KEY:
         logger.error("OPENAI_API_KEY topilmadi.")
         return None
     try:
-        return OpenAI(api_key=OPENAI_API_KEY)
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+        )
+        # qayta urinishlarni o‘zimiz boshqaramiz (asyncio.sleep bilan)
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+        return _client
     except Exception as e:
         logger.exception("OpenAI klientini yaratishda xatolik: %s", e)
         return None
 
-# === Superscript / LaTeX tozalash ===
-_SUP_MAP = {"0": "⁰","1": "¹","2": "²","3": "³","4": "⁴","5": "⁵","6": "⁶","7": "⁷","8": "⁸","9": "⁹","-": "⁻","+": "⁺"}
-def _to_superscript(s: str) -> str:
-    return "".join(_SUP_MAP.get(ch, ch) for ch in s)
+async def close_client():
+    """Ulanishlar pulini yopadi (on_shutdown uchun)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
-def _replace_superscripts(text: str) -> str:
-    text = re.sub(r"\^\{([^}]+)\}", lambda m: _to_superscript(m.group(1)), text)
-    text = re.sub(r"([A-Za-z0-9\)])\^([0-9])", lambda m: m.group(1)+_to_superscript(m.group(2)), text)
-    return text
+# === So‘rov hajmi: prompt tokenlari taxmini + javob uchun max_tokens ===
+def _max_tokens_for(task: str) -> int:
+    return int(TASK_MAX_TOKENS.get(task, MAX_TOKENS))
 
-def _clean_latex(text: str) -> str:
-    if not text:
-        return text
-    text = re.sub(r"\$\$(.*?)\$\$|\$(.*?)\$|\\\((.*?)\\\)|\\\[(.*?)\\\]", lambda m: "".join(x for x in m.groups() if x), text)
-    text = re.sub(r"\\frac\s*\{([^{}]+)\}\s*\{([^{}]+)\}", r"\1/\2", text)
-    text = re.sub(r"\\sqrt\s*\{([^{}]+)\}", r"√(\1)", text)
-    text = re.sub(r"\\left|\\right", "", text)
-    replace_map = {
-        r"\\leq": "≤", r"\\geq": "≥", r"\\neq": "≠", r"\\times": "×", r"\\cdot": "·",
-        r"\\pm": "±", r"\\approx": "≈", r"\\to": "→", r"\\infty": "∞", r"\\degree": "°",
-        r"\\alpha": "α", r"\\beta": "β", r"\\gamma": "γ", r"\\pi": "π"
-    }
-    for pat, rep in replace_map.items():
-        text = re.sub(pat, rep, text)
-    text = _replace_superscripts(text)
-    text = re.sub(r"\\[a-zA-Z]+\s*", "", text)
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"\s*([=+\-*/×·≥≤≠±<>])\s*", r" \1 ", text)
-    return text.strip()
+def _size_request(model: str, messages: list, max_tokens: int):
+    """(max_tokens, limiter uchun jami token) — model kontekstiga sig‘magan so‘rov API ga yuborilmaydi."""
+    prompt_tokens = estimate_messages(messages)
+    max_tokens = budget_max_tokens(model, prompt_tokens, max_tokens)
+    return max_tokens, prompt_tokens + max_tokens
 
 # === Chat fallback yordamchisi ===
-def _call_chat_completions(client: OpenAI, model: str, messages: list, temperature: float, max_tokens: int):
+async def _call_chat_completions(client: AsyncOpenAI, model: str, messages: list, temperature: float, max_tokens: int):
     attempts, backoff = 0, 1
-    cur_model = model
-    while attempts < 3:
+    max_tokens, est_tokens = _size_request(model, messages, max_tokens)
+    while attempts < OPENAI_MAX_ATTEMPTS:
         attempts += 1
         try:
-            return client.chat.completions.create(
-                model=cur_model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            # RPM/TPM kvotasi va ustuvorlik navbati
+            async with openai_slot(model, est_tokens) as permit:
+                started = time.monotonic()
+                try:
+                    resp = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                except Exception as e:
+                    metrics.record_openai(model, time.monotonic() - started, ok=False)
+                    _record_upstream(time.monotonic() - started, e)
+                    raise
+                _record_upstream(time.monotonic() - started)
+                metrics.record_openai(model, time.monotonic() - started, resp.usage)
+                if resp.usage:
+                    permit.actual_tokens = resp.usage.total_tokens
+                return resp
         except Exception as e:
             err = str(e).lower()
             logger.warning(f"Xatolik ({attempts}-urinish): {err}")
-            if "not found" in err and cur_model != "gpt-3.5-turbo":
-                cur_model = "gpt-3.5-turbo"
-                continue
-            if any(code in err for code in ["429","500","502","503"]):
-                time.sleep(backoff)
+            if any(code in err for code in ["429","500","502","503","timed out","connection"]):
+                # event loop bloklanmaydi — boshqa yangilanishlar ishlayveradi
+                await asyncio.sleep(backoff)
                 backoff *= 2
                 continue
             raise
     raise RuntimeError("OpenAI javobi olinmadi.")
 
+async def _continue(client: AsyncOpenAI, model: str, messages: list, temperature: float, text: str,
+                    on_text=None) -> str:
+    """Kesilgan matnni token byudjeti tugaguncha yoki javob to‘liq bo‘lguncha davom ettiradi."""
+    started = time.monotonic()
+    rounds, tokens, finish = 0, 0, "length"
+    while finish == "length" and rounds < CONTINUE_MAX_ROUNDS and tokens < CONTINUE_TOKEN_BUDGET:
+        rounds += 1
+        resp = await _call_chat_completions(
+            client, model,
+            messages + [{"role": "assistant", "content": text}, {"role": "user", "content": CONTINUE_PROMPT}],
+            temperature, min(MAX_TOKENS, CONTINUE_TOKEN_BUDGET - tokens)
+        )
+        choice = resp.choices[0]
+        text += choice.message.content or ""
+        finish = choice.finish_reason
+        tokens += resp.usage.completion_tokens if resp.usage else MAX_TOKENS
+        if on_text is not None:
+            await on_text(text)
+
+    elapsed = time.monotonic() - started
+    continuation_stats["requests"] += 1
+    continuation_stats["rounds"] += rounds
+    continuation_stats["tokens"] += tokens
+    continuation_stats["seconds"] += elapsed
+    if finish == "length":
+        continuation_stats["exhausted"] += 1
+    logger.info("Davom ettirish (%s): %d marta, +%d token, +%.1f s%s",
+                model, rounds, tokens, elapsed, " — byudjet tugadi" if finish == "length" else "")
+    return text
+
+async def _complete(client: AsyncOpenAI, model: str, messages: list, temperature: float, max_tokens: int) -> str:
+    """Bitta so‘rov; javob uzunlik chegarasida kesilgan bo‘lsa, avtomatik davom ettiriladi."""
+    resp = await _call_chat_completions(client, model, messages, temperature, max_tokens)
+    choice = resp.choices[0]
+    text = choice.message.content or ""
+    if choice.finish_reason == "length":
+        text = await _continue(client, model, messages, temperature, text)
+    return text
+
+# === Oqimli (stream) chaqiruv: matn kelishi bilan on_text(jami_matn) ===
+async def _stream_chat_completions(client: AsyncOpenAI, model: str, messages: list, temperature: float,
+                                   max_tokens: int, on_text) -> str:
+    text = ""  # har delta da qayta join qilinmaydi
+    finish = None
+    usage = None
+    max_tokens, est_tokens = _size_request(model, messages, max_tokens)
+    started = time.monotonic()
+    try:
+        async with openai_slot(model, est_tokens) as permit:
+            started = time.monotonic()
+            first_chunk = None  # breaker uchun kechikish — birinchi bo‘lakkacha (uzun javob sekin emas)
+            try:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    # oxirgi (choices siz) bo‘lakda token sarfi keladi
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if first_chunk is None:
+                        first_chunk = time.monotonic() - started
+                    if chunk.usage:
+                        usage = chunk.usage
+                        permit.actual_tokens = usage.total_tokens
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    finish = chunk.choices[0].finish_reason or finish
+                    if delta:
+                        text += delta
+                        # LiveMessage.push o‘zi tahrir vaqtini tekshiradi — vaqt kelmagan bo‘lsa darhol qaytadi
+                        await on_text(text)
+            except Exception as e:
+                # on_text dan kelgan Telegram xatolari _is_backend_failure da hisobga olinmaydi
+                _record_upstream(time.monotonic() - started, e)
+                raise
+            _record_upstream(first_chunk if first_chunk is not None else time.monotonic() - started)
+        metrics.record_openai(model, time.monotonic() - started, usage)
+    except Exception as e:
+        metrics.record_openai(model, time.monotonic() - started, ok=False)
+        if text:
+            raise
+        # birinchi token kelmasdan xato — oddiy (qayta urinishli) chaqiruvga o‘tamiz
+        logger.warning("Stream ochilmadi, oddiy so‘rovga o‘tildi: %s", e)
+        return await _complete(client, model, messages, temperature, max_tokens)
+    if finish == "length":
+        return await _continue(client, model, messages, temperature, text, on_text)
+    return text
+
+def format_partial(text: str) -> str:
+    """Oqim davomida chala matnni foydalanuvchiga ko‘rsatish uchun tozalaydi (yakuniy matn kabi)."""
+    return _clean_latex(text.strip())
+
+# === Circuit breaker: har bir HTTP so‘rov (slot olingandan keyin) alohida baholanadi ===
+def _is_backend_failure(e: Exception) -> bool:
+    # faqat tarmoq/timeout va 429/5xx; 4xx, Telegram va dasturdagi xatolar OpenAI nosozligi emas
+    if isinstance(e, APIStatusError):
+        return e.status_code == 429 or e.status_code >= 500
+    return isinstance(e, (APIConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+def _record_upstream(latency: float, error: Exception = None):
+    """Navbat, backoff, hedge va davom ettirish kutishlari bu vaqtga kirmaydi."""
+    if error is None:
+        openai_breaker.record(True, latency)
+    elif _is_backend_failure(error):
+        openai_breaker.record(False, latency)
+
+async def _guarded(call):
+    """Faqat kirish tekshiruvi: breaker ochiq bo‘lsa, so‘rov navbatga ham qo‘yilmaydi."""
+    if not openai_breaker.allow():
+        raise CircuitOpenError()
+    try:
+        return await call()
+    finally:
+        # half_open sinovi natija yozmasdan tugagan bo‘lsa (bekor/boshqa xato), joy bo‘shaydi;
+        # natija yozilgan bo‘lsa holat allaqachon closed/open — bu no-op
+        openai_breaker.abandon()
+
+# === Keshlangan va birlashtirilgan generatsiya ===
+_generation_flight = SingleFlight("generation")
+
+def is_error_text(text: str) -> bool:
+    """generate_* xatolikda "❌" bilan boshlanuvchi matn qaytaradi."""
+    return not text or text.startswith("❌")
+
+async def _generate(client: AsyncOpenAI, task: str, key_parts: tuple, messages: list, temperature: float,
+                    on_text=None, raw_call=None) -> str:
+    """raw_call() berilsa, bitta chat so‘rovi o‘rniga u ishlatiladi (xom matn qaytaradi)."""
+    # metrika label'i shu chaqiruv bilan cheklanadi — keyingi chaqiruvlarga o‘tmaydi
+    label = metrics.openai_task.set(task)
+    try:
+        # hozirgi birinchi model kaliti bilan qidiriladi; u nosoz bo‘lsa — zaxira modelning keshi
+        primary = model_router.plan(task)[0][0]
+        key = gen_cache.make_key(task, primary, temperature, *key_parts)
+        cached = await gen_cache.get(key)
+        if cached is not None:
+            return cached
+        max_tokens = _max_tokens_for(task)
+        answered = []
+
+        async def _call():
+            model_router.answered_by.set(answered)
+            if raw_call is not None:
+                return await raw_call()
+            if on_text is not None:
+                # oqimni hedge qilib bo‘lmaydi — eng sog‘lom model tanlanadi
+                answered.append(primary)
+                return await _stream_chat_completions(client, primary, messages, temperature, max_tokens, on_text)
+            return await model_router.hedged(
+                task, lambda model: _complete(client, model, messages, temperature, max_tokens)
+            )
+
+        async def _fetch():
+            raw = await _guarded(_call)
+            if LATEX_CORPUS_DIR:
+                try:
+                    await asyncio.to_thread(capture_sample, f"{task}_{key[:12]}", raw)
+                except OSError as e:
+                    logger.warning("Korpus namunasi yozilmadi: %s", e)
+            text = _clean_latex(raw.strip())
+            # javob bergan model(lar) kaliti bilan saqlanadi — zaxira javobi asosiy model nomidan berilmaydi
+            models = "+".join(sorted(set(answered))) or primary
+            store_key = key if models == primary else gen_cache.make_key(task, models, temperature, *key_parts)
+            await gen_cache.put(store_key, task, gen_cache.make_label(*key_parts), text)
+            return text
+
+        # bir vaqtda kelgan bir xil so‘rovlar bitta OpenAI chaqiruvini kutadi
+        # (oqimni faqat birinchi chaqiruvchi ko‘radi, qolganlar tayyor natijani oladi)
+        return await _generation_flight.do(key, _fetch)
+    finally:
+        metrics.openai_task.reset(label)
+
 # === Konspekt ===
 SYSTEM_PROMPT_CONSPECT = (
     "Siz O‘zbekiston umumta’lim maktablari uchun metodist-o‘qituvchisiz. "
@@ -111,22 +336,24 @@ Eslatma:
 - Matn soddaligi va o‘qituvchilik tili saqlansin.
 """
 
-def generate_conspect(subject: str, grade: str, topic: str) -> str:
+async def generate_conspect(subject: str, grade: str, topic: str, on_text=None) -> str:
     client = _get_client()
     if not client:
         return "❌ Konspekt yaratishda xatolik: API kaliti yo‘q."
     try:
-        resp = _call_chat_completions(
-            client, DEFAULT_MODEL,
+        check_input(topic, MAX_TOPIC_TOKENS, "Mavzu")
+        return await _generate(
+            client, "conspect", (subject, grade, topic),
             [
                 {"role": "system", "content": SYSTEM_PROMPT_CONSPECT},
                 {"role": "user", "content": _build_conspect_prompt(subject, grade, topic)}
             ],
-            TEMPERATURE, MAX_TOKENS
+            TEMPERATURE, on_text
         )
-        return _clean_latex(resp.choices[0].message.content.strip())
+    except (CircuitOpenError, PromptTooLargeError) as e:
+        return str(e)
     except Exception as e:
-        return f"Konspekt yaratishda xatolik yuz berdi: {str(e)}"
+        return f"❌ Konspekt yaratishda xatolik yuz berdi: {str(e)}"
 
 # === Dars ishlanma ===
 SYSTEM_PROMPT_LESSON = (
@@ -162,25 +389,97 @@ Eslatma:
 - Matn o‘qituvchi uchun tayyor hujjatga o‘xshasin.
 """
 
-def generate_lesson_plan(subject: str, grade: str, topic: str) -> str:
+# bo‘lim guruhlari: har biri alohida so‘rov, natijalar shu tartibda ulanadi
+_LESSON_SECTION_GROUPS = [
+    """1. Mavzu nomi
+2. Maqsadlar: ta’limiy, tarbiyaviy, rivojlantiruvchi
+3. Jihozlar va ko‘rgazmali vositalar
+4. Metodik yondashuvlar (kamida 4 ta interfaol metod bilan)""",
+    """5. Darsning borishi:
+   - Kirish (motivatsiya, aqliy hujum)
+   - Yangi mavzu bayoni (misollar bilan tushuntirish)
+   - Amaliy mashqlar (o‘quvchi ishtirokida)
+   - Mustahkamlash
+6. Har bosqichda o‘qituvchi va o‘quvchi faoliyati""",
+    """7. Kamida 10 misol va ularning yechimlari""",
+    """8. Mustahkamlash uchun 10 topshiriq
+9. Baholash mezonlari
+10. Uyga vazifa: ijodiy va amaliy mashqlar""",
+]
+
+def _build_lesson_outline_prompt(subject: str, grade: str, topic: str) -> str:
+    return f"""
+Fan: {subject}
+Sinf: {grade}
+Mavzu: {topic}
+
+Shu mavzu bo‘yicha dars ishlanmaning QISQA REJASINI tuzing (10–15 qator):
+asosiy tushunchalar, dars bosqichlari, qo‘llaniladigan interfaol metodlar,
+misol va topshiriqlar qaysi turda bo‘lishi. To‘liq matn yozmang.
+"""
+
+def _build_lesson_section_prompt(subject: str, grade: str, topic: str, outline: str, sections: str) -> str:
+    return f"""
+Fan: {subject}
+Sinf: {grade}
+Mavzu: {topic}
+
+Dars ishlanmaning umumiy rejasi:
+{outline}
+
+Shu rejaga tayangan holda dars ishlanmaning FAQAT quyidagi bo‘limlarini to‘liq yozing
+(raqamlarini saqlang, boshqa bo‘limlarni, kirish yoki xulosa so‘zlarini yozmang):
+{sections}
+
+Eslatma:
+- Har bir formulani izohli yozing: masalan, “S — yuzasi, a va b — tomonlar”.
+- Matn o‘qituvchi uchun tayyor hujjatga o‘xshasin.
+"""
+
+async def _lesson_parallel(client: AsyncOpenAI, subject: str, grade: str, topic: str) -> str:
+    """Avval qisqa reja, so‘ng bo‘lim guruhlari parallel; natija tartib bilan ulanadi."""
+    def _ask(prompt: str, max_tokens: int):
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT_LESSON},
+            {"role": "user", "content": prompt}
+        ]
+        return model_router.hedged(
+            "lesson", lambda model: _complete(client, model, messages, TEMPERATURE, max_tokens)
+        )
+
+    outline = (await _ask(_build_lesson_outline_prompt(subject, grade, topic), LESSON_OUTLINE_TOKENS)).strip()
+
+    # bitta bo‘lim xato bersa — gather qolganlarini ham to‘xtatadi, chala hujjat keshlanmaydi
+    responses = await asyncio.gather(*(
+        _ask(_build_lesson_section_prompt(subject, grade, topic, outline, group), LESSON_SECTION_TOKENS)
+        for group in _LESSON_SECTION_GROUPS
+    ))
+    return "\n\n".join(r.strip() for r in responses)
+
+async def generate_lesson_plan(subject: str, grade: str, topic: str) -> str:
     client = _get_client()
     if not client:
         return "❌ Dars ishlanma yaratishda xatolik: API kaliti yo‘q."
     try:
-        resp = _call_chat_completions(
-            client, DEFAULT_MODEL,
+        check_input(topic, MAX_TOPIC_TOKENS, "Mavzu")
+        raw_call = (lambda: _lesson_parallel(client, subject, grade, topic)) if LESSON_PARALLEL else None
+        # ikki rejim matni farq qiladi — kesh kalitida rejim ham bor
+        mode = "parallel" if LESSON_PARALLEL else "single"
+        return await _generate(
+            client, "lesson", (subject, grade, topic, mode),
             [
                 {"role": "system", "content": SYSTEM_PROMPT_LESSON},
                 {"role": "user", "content": _build_lesson_prompt(subject, grade, topic)}
             ],
-            TEMPERATURE, MAX_TOKENS
+            TEMPERATURE, raw_call=raw_call
         )
-        return _clean_latex(resp.choices[0].message.content.strip())
+    except (CircuitOpenError, PromptTooLargeError) as e:
+        return str(e)
     except Exception as e:
-        return f"Dars ishlanma yaratishda xatolik: {str(e)}"
+        return f"❌ Dars ishlanma yaratishda xatolik: {str(e)}"
 
 # === Metodik maslahat ===
-def generate_methodical_advice(subject: str, grade: str, topic: str) -> str:
+async def generate_methodical_advice(subject: str, grade: str, topic: str) -> str:
     client = _get_client()
     if not client:
         return "❌ Metodik maslahat olishda xatolik: API kaliti topilmadi."
@@ -204,13 +503,15 @@ Matn soddaligi, amaliyligi va foydaliligiga e’tibor bering.
     ]
 
     try:
-        resp = _call_chat_completions(client, DEFAULT_MODEL, messages, 0.6, MAX_TOKENS)
-        text = resp.choices[0].message.content.strip()
-        return "📙 METODIK MASLAHAT 📙\n\n" + _clean_latex(text)
+        check_input(topic, MAX_TOPIC_TOKENS, "Mavzu")
+        text = await _generate(client, "advice", (subject, grade, topic), messages, 0.6)
+        return "📙 METODIK MASLAHAT 📙\n\n" + text
+    except (CircuitOpenError, PromptTooLargeError) as e:
+        return str(e)
     except Exception as e:
         return f"❌ Metodik maslahat olishda xatolik: {str(e)}"
 
-def analyze_teaching_problem(problem_text: str) -> str:
+async def analyze_teaching_problem(problem_text: str) -> str:
     """
     O‘qituvchining muammosini tahlil qilib, yechimlar va tavsiyalar beradi.
     """
@@ -235,15 +536,20 @@ Matn soddaligi, foydaliligi va real qo‘llashga yaroqliligi bilan yozilsin.
 """
 
     try:
-        resp = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=[
-                {"role": "system", "content": "Siz metodik tahlilchi va ustozlarga yordam beruvchi sun’iy intellektsiz."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=MAX_TOKENS
-        )
-        return "🪄 " + resp.choices[0].message.content.strip()
+        check_input(problem_text, MAX_INPUT_TOKENS, "Muammo matni")
+        messages = [
+            {"role": "system", "content": "Siz metodik tahlilchi va ustozlarga yordam beruvchi sun’iy intellektsiz."},
+            {"role": "user", "content": prompt}
+        ]
+        label = metrics.openai_task.set("problem")
+        try:
+            text = await _guarded(lambda: model_router.hedged(
+                "problem", lambda model: _complete(client, model, messages, 0.7, _max_tokens_for("problem"))
+            ))
+        finally:
+            metrics.openai_task.reset(label)
+        return "🪄 " + text.strip()
+    except (CircuitOpenError, PromptTooLargeError) as e:
+        return str(e)
     except Exception as e:
         return f"❌ Tahlil qilishda xatolik yuz berdi: {str(e)}"
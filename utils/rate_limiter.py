@@ -0,0 +1,156 @@
+import os
+import json
+import heapq
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# === OpenAI kvotalari (daqiqasiga) ===
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+# model bo‘yicha alohida: '{"gpt-4o-mini": [500, 200000], "gpt-3.5-turbo": [3500, 160000]}'
+OPENAI_MODEL_LIMITS = json.loads(os.getenv("OPENAI_MODEL_LIMITS", "{}") or "{}")
+
+# === Ustuvorlik: kichik raqam — birinchi ===
+PRIORITY_PREMIUM = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+# slot olinganda chaqiriladi (model_router hedge soatini shundan boshlaydi)
+slot_acquired: ContextVar[Optional[Callable[[], None]]] = ContextVar("slot_acquired", default=None)
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._ts = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def wait_time(self, amount: float) -> float:
+        missing = amount - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+
+# === Bitta model uchun: so‘rov + token chelaklari va parallellik chegarasi ===
+class ModelLimiter:
+    def __init__(self, model: str, rpm: int, tpm: int, max_concurrency: int):
+        self.model = model
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._waiters = []  # (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._timer = None
+
+    def queue_depth(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    async def acquire(self, tokens: int, priority: int) -> int:
+        tokens = min(max(1, tokens), int(self.tokens.capacity))
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(tokens, tokens)  # ruxsat berilgan edi — qaytaramiz
+            raise
+        return tokens
+
+    def release(self, reserved: int, actual: int = None):
+        self.in_flight -= 1
+        if actual is not None and actual != reserved:
+            # taxminiy va haqiqiy token farqini chelakka qaytaramiz/yechamiz
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - actual)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while self._waiters:
+            priority, seq, tokens, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                return  # release() qayta chaqiradi
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if delay > 0:
+                # navbat boshidagi kutadi — adolatli tartib buzilmaydi
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            self.in_flight += 1
+            fut.set_result(None)
+
+
+_limiters: Dict[str, ModelLimiter] = {}
+
+def _limiter_for(model: str) -> ModelLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        rpm, tpm = OPENAI_MODEL_LIMITS.get(model, (OPENAI_RPM, OPENAI_TPM))
+        limiter = _limiters[model] = ModelLimiter(model, rpm, tpm, OPENAI_MAX_CONCURRENCY)
+    return limiter
+
+
+class _Permit:
+    def __init__(self, limiter: ModelLimiter, tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.actual_tokens = None  # javobdagi usage.total_tokens bilan yangilanadi
+
+
+@asynccontextmanager
+async def openai_slot(model: str, est_tokens: int, priority: int = None):
+    """
+    `async with openai_slot(model, tokens): ...` — kvota va navbat bo‘yicha ruxsat.
+    Ustuvorlik berilmasa, request_priority kontekstidan olinadi.
+    """
+    limiter = _limiter_for(model)
+    prio = request_priority.get() if priority is None else priority
+    reserved = await limiter.acquire(est_tokens, prio)
+    permit = _Permit(limiter, reserved)
+    notify = slot_acquired.get()
+    if notify is not None:
+        notify()
+    try:
+        yield permit
+    finally:
+        limiter.release(reserved, permit.actual_tokens)
+
+
+def queue_depth() -> int:
+    return sum(l.queue_depth() for l in _limiters.values())
+
+def snapshot() -> dict:
+    return {
+        model: {
+            "queue": l.queue_depth(),
+            "in_flight": l.in_flight,
+            "rpm_left": int(l.requests.level),
+            "tpm_left": int(l.tokens.level),
+        }
+        for model, l in _limiters.items()
+    }
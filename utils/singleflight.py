@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+# === Bir xil kalitli parallel chaqiruvlarni birlashtirish ===
+class SingleFlight:
+    """
+    Bir kalit bo‘yicha faqat bitta ish bajariladi; shu vaqtda kelgan
+    boshqa chaqiruvlar o‘sha natijani (yoki xatoni) kutib oladi.
+    Ish alohida task'da yuradi — birinchi chaqiruvchi bekor qilinsa ham
+    qolganlar natijani oladi.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # hamma kutuvchilar bekor qilingan bo‘lsa ham xato "yutilmasin"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("%s[%s] xato bilan tugadi: %s", self.name, key[:12], task.exception())
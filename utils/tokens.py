@@ -0,0 +1,84 @@
+import os
+import re
+import json
+import math
+
+# === Oflayn token taxmini (o‘zbek lotin/kirill matni uchun) ===
+# OpenAI BPE lug‘ati ingliz matniga moslangan: o‘zbekcha so‘zlar bo‘linib ketadi,
+# kirill harflari esa yana ham mayda bo‘laklarga tushadi. Koeffitsientlar
+# ataylab biroz ortig‘i bilan olingan: limiter uchun kam sanagandan ko‘p sanagan yaxshi.
+LATIN_CHARS_PER_TOKEN = 3.2
+CYRILLIC_CHARS_PER_TOKEN = 2.2
+MESSAGE_OVERHEAD = 4   # har bir xabar uchun rol/ajratuvchi tokenlar
+REPLY_OVERHEAD = 3
+
+MODEL_CONTEXT = {"gpt-4o-mini": 128000, "gpt-4o": 128000, "gpt-3.5-turbo": 16385}
+MODEL_CONTEXT.update(json.loads(os.getenv("MODEL_CONTEXT", "{}") or "{}"))
+DEFAULT_CONTEXT = 16385
+CONTEXT_MARGIN = 64
+
+# foydalanuvchi kiritadigan maydonlar (mavzu, muammo matni) uchun chegaralar
+MAX_TOPIC_TOKENS = int(os.getenv("MAX_TOPIC_TOKENS", "150"))
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "1500"))
+
+# so‘z (apostrofli o‘zbekcha harflar bilan), raqamlar guruhi yoki bitta belgi
+_PIECE = re.compile(r"[^\W\d_]+(?:['‘’ʻʼ`][^\W\d_]+)*|\d{1,3}|\S")
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+_APOSTROPHES = re.compile(r"['‘’ʻʼ`]")
+
+
+class PromptTooLargeError(ValueError):
+    """Kiritilgan matn API ga yuborish uchun juda katta."""
+
+
+def _piece_tokens(piece: str) -> int:
+    if len(piece) == 1 or piece.isdigit():
+        return 1
+    if _CYRILLIC.search(piece):
+        per_token = CYRILLIC_CHARS_PER_TOKEN
+    elif piece.isascii() or _APOSTROPHES.search(piece):
+        per_token = LATIN_CHARS_PER_TOKEN
+    else:
+        return len(piece)
+    # o‘ʻ, gʻ kabi apostroflar odatda alohida token bo‘lib ketadi
+    return math.ceil(len(piece) / per_token) + len(_APOSTROPHES.findall(piece))
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return sum(_piece_tokens(p) for p in _PIECE.findall(text))
+
+
+def estimate_messages(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def context_window(model: str) -> int:
+    return MODEL_CONTEXT.get(model, DEFAULT_CONTEXT)
+
+
+def budget_max_tokens(model: str, prompt_tokens: int, wanted: int) -> int:
+    """Javob uchun max_tokens: xohlangan qiymat, lekin model konteksti sig‘adigan qadar."""
+    room = context_window(model) - prompt_tokens - CONTEXT_MARGIN
+    if room <= 0:
+        raise PromptTooLargeError(
+            f"❌ So‘rov juda katta: taxminan {prompt_tokens} token (model chegarasi {context_window(model)})."
+        )
+    return max(1, min(wanted, room))
+
+
+def check_input(text: str, limit: int, what: str = "Matn"):
+    """Foydalanuvchi matnini API ga yuborishdan oldin tekshiradi."""
+    tokens = estimate_tokens(text)
+    if tokens > limit:
+        raise PromptTooLargeError(
+            f"❌ {what} juda uzun (taxminan {tokens} token, maksimum {limit}). Iltimos, qisqartiring."
+        )
+    return tokens
+
+
+def split_topic(text: str) -> list:
+    """Juda uzun katak bir nechta mavzudan iborat bo‘lsa (qator yoki ';' bilan), ularni ajratadi."""
+    parts = [p.strip(" \t-•.") for p in re.split(r"[\r\n;]+", text)]
+    return [p for p in parts if p]
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+from aiogram import Bot, Dispatcher, types
+
+logger = logging.getLogger(__name__)
+
+
+# === Webhook yangilanishlari uchun chegaralangan navbat ===
+class UpdateQueue:
+    """
+    Webhook yangilanishni navbatga qo‘yib darhol "ok" qaytaradi,
+    N ta worker esa ularni fon rejimida dp.feed_update orqali ishlaydi.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = 8, maxsize: int = 500,
+                 put_timeout: float = 2.0, dedup_size: int = 5000):
+        self.dp = dp
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.put_timeout = put_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list = []
+        self._seen_ids: set = set()
+        self._seen_order: deque = deque()
+        self._dedup_size = dedup_size
+        self._accepting = False
+
+    def start(self):
+        self._accepting = True
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i), name=f"update-worker-{i}"))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    # === Takroriy update_id larni eslab qolish ===
+    def _is_duplicate(self, update_id: int) -> bool:
+        return update_id in self._seen_ids
+
+    def _remember(self, update_id: int):
+        self._seen_ids.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > self._dedup_size:
+            self._seen_ids.discard(self._seen_order.popleft())
+
+    def _forget(self, update_id: int):
+        # faqat navbatga qo‘yilmagan update uchun (kam uchraydi) — deque dan ham olib tashlanadi
+        self._seen_ids.discard(update_id)
+        try:
+            self._seen_order.remove(update_id)
+        except ValueError:
+            pass
+
+    async def put(self, update: types.Update) -> Optional[bool]:
+        """
+        True — navbatga qo‘yildi, None — takroriy (e’tiborsiz qoldirildi),
+        False — navbat to‘la yoki yopilmoqda (Telegram keyinroq qayta yuboradi).
+        """
+        if not self._accepting:
+            return False
+        if self._is_duplicate(update.update_id):
+            return None
+        # await dan oldin — bir vaqtda kelgan ikkita qayta yuborish ikkalasi ham o‘tib ketmasin
+        self._remember(update.update_id)
+        try:
+            await asyncio.wait_for(self._queue.put(update), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            # 503 qaytadi — Telegram qayta yuborganda update qabul qilinishi kerak
+            self._forget(update.update_id)
+            logger.warning("Navbat to‘la (%s), update %s rad etildi.", self._queue.qsize(), update.update_id)
+            return False
+        except asyncio.CancelledError:
+            self._forget(update.update_id)
+            raise
+        return True
+
+    async def _worker(self, n: int):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception("Update %s qayta ishlashda xato: %s", update.update_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = 30.0):
+        """Yangi update qabul qilmaydi, navbatdagilarni tugatadi va workerlarni to‘xtatadi."""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Navbat %s soniyada bo‘shamadi, %s ta update qoldi.", timeout, self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()